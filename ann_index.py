@@ -0,0 +1,279 @@
+"""
+ann_index.py – Ligikaudse lähima naabri (ANN) indeksid mitme aasta / ülikooli kataloogi jaoks.
+
+Mõlemal taustal on sama liides nagu CourseIndex.search():
+    search(normaliseeritud_päring, k, mask) -> (reapositsioonid, skoorid)
+
+Vektorid antakse massiivina või massiivilaadse objektina (len, shape ja
+read[positsioonid] -> float32), nt EmbeddingStore.view() kvantiseeritud
+hoidlast. Indeks ei hoia vektoritest oma koopiat: IVF loeb päringu ajal
+ainult läbitavate klastrite read.
+
+    ivf   – NumPy IVF: sfääriline k-means jagab vektorid nlist klastrisse,
+            päring skoorib ainult nprobe lähima klastri vektorid. Filtrimask
+            rakendatakse kandidaatidele enne skoorimist; kui maskiga jääb alla k
+            kandidaadi, suurendatakse nprobe'i (filtreeritud läbimine).
+    hnsw  – hnswlib (valikuline sõltuvus). Maski korral küsitakse rohkem
+            naabreid (oversampling) ja filtreeritakse tagantjärele; kui ka siis
+            ei jätku, tehakse täpne otsing maskiga ridade seas.
+
+Rakenduses ja benchmarkis lülitatakse sisse keskkonnamuutujaga ANN_BACKEND=ivf|hnsw.
+
+Mõõtmine (kataloogi suuruse järgi, latentsus ja recall täpse otsingu suhtes):
+    python ann_index.py --sizes 3000,30000,100000 --dim 256
+    python ann_index.py --replicate --sizes 3000,12000,48000   # päris vektorid + müra
+"""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+from course_index import top_positions
+
+ANN_BACKENDS = ("ivf", "hnsw")
+
+# IVF vaikeväärtused
+IVF_TRAIN_SAMPLE = 20000
+IVF_ITERATIONS = 10
+DEFAULT_NPROBE = 16
+
+# HNSW vaikeväärtused
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+# Maski korral küsitakse k / selektiivsus * OVERSAMPLE naabrit
+HNSW_OVERSAMPLE = 2.0
+
+
+def _rows(matrix, rows) -> np.ndarray:
+    return np.asarray(matrix[rows], dtype=np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted file indeks normaliseeritud vektoritele (sisekorrutis = kosinus).
+    Hoitakse ainult keskpunkte ja klastrite järjestust; vektorid loetakse
+    matrix'ist (mälus massiiv või hoidla vaade) päringu ajal.
+    """
+
+    def __init__(self, matrix, nlist: int | None = None, nprobe: int = DEFAULT_NPROBE,
+                 seed: int = 0):
+        self.matrix = matrix
+        n = len(matrix)
+        if n == 0:
+            self.nlist = self.nprobe = 0
+            self.centroids = np.empty((0, matrix.shape[1]), dtype=np.float32)
+            self.order = np.empty(0, dtype=np.int64)
+            self.offsets = np.zeros(1, dtype=np.int64)
+            return
+        self.nlist = max(1, min(n, nlist or int(math.sqrt(n))))
+        self.nprobe = max(1, min(nprobe, self.nlist))
+        self.centroids = self._train(matrix, seed)
+
+        assign = self._assign(matrix)
+        # Read klastrite kaupa (CSR): klastri c read on order[offsets[c]:offsets[c+1]]
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(self.nlist + 1))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _assign(self, matrix, chunk: int = 8192) -> np.ndarray:
+        out = np.empty(len(matrix), dtype=np.int64)
+        for start in range(0, len(matrix), chunk):
+            out[start:start + chunk] = np.argmax(_rows(matrix, slice(start, start + chunk)) @ self.centroids.T, axis=1)
+        return out
+
+    def _train(self, matrix, seed: int) -> np.ndarray:
+        """Sfääriline k-means valimi peal."""
+        rng = np.random.default_rng(seed)
+        if len(matrix) > IVF_TRAIN_SAMPLE:
+            sample = _rows(matrix, np.sort(rng.choice(len(matrix), IVF_TRAIN_SAMPLE, replace=False)))
+        else:
+            sample = _rows(matrix, slice(None))
+        self.centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(IVF_ITERATIONS):
+            assign = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=self.nlist) == 0
+            # Tühjad klastrid saavad uue juhusliku keskpunkti
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+        return self.centroids
+
+    def search(self, query: np.ndarray, k: int = 5,
+               mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        if len(self.order) == 0 or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        probe_order = np.argsort(-(self.centroids @ query))
+        nprobe = self.nprobe
+        while True:
+            lists = probe_order[:nprobe]
+            slots = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+            if mask is not None:
+                slots = slots[mask[self.order[slots]]]
+            if len(slots) >= k or nprobe >= self.nlist:
+                break
+            nprobe = min(self.nlist, nprobe * 2)
+
+        if len(slots) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = self.order[slots]
+        top, scores = top_positions(_rows(self.matrix, rows) @ query, k)
+        return rows[top], scores
+
+
+class HNSWIndex:
+    """hnswlib graafiindeks (pip install hnswlib)."""
+
+    def __init__(self, matrix, m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION,
+                 ef_search: int = HNSW_EF_SEARCH, chunk: int = 8192):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("HNSW taust vajab hnswlib paketti: pip install hnswlib") from e
+        # hnswlib hoiab graafis oma koopiat; siin jääb ainult viide (täpse otsingu varuvariandiks)
+        self.matrix = matrix
+        n, dim = matrix.shape
+        self.index = hnswlib.Index(space="ip", dim=dim)
+        self.index.init_index(max_elements=max(1, n), ef_construction=ef_construction, M=m)
+        for start in range(0, n, chunk):
+            stop = min(n, start + chunk)
+            self.index.add_items(_rows(matrix, slice(start, stop)), np.arange(start, stop))
+        self.index.set_ef(ef_search)
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def _knn(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        labels, distances = self.index.knn_query(query[None, :], k=k)
+        # "ip" ruumis on kaugus 1 - sisekorrutis
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def search(self, query: np.ndarray, k: int = 5,
+               mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        n = len(self)
+        k = min(k, n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if mask is None:
+            return self._knn(query, k)
+
+        allowed = int(mask.sum())
+        if allowed == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        fetch = min(n, math.ceil(k * n / allowed * HNSW_OVERSAMPLE))
+        while fetch < n:
+            labels, scores = self._knn(query, fetch)
+            keep = mask[labels]
+            if keep.sum() >= min(k, allowed):
+                return labels[keep][:k], scores[keep][:k]
+            fetch = min(n, fetch * 4)
+        # Väga range filter: täpne otsing lubatud ridade seas
+        rows = np.flatnonzero(mask)
+        top, scores = top_positions(_rows(self.matrix, rows) @ query, k)
+        return rows[top], scores
+
+
+def build_ann(matrix, backend: str, **params):
+    """Ehitab ANN indeksi normaliseeritud maatriksi (või hoidla vaate) põhjal."""
+    if backend == "ivf":
+        return IVFIndex(matrix, **params)
+    if backend == "hnsw":
+        return HNSWIndex(matrix, **params)
+    raise ValueError(f"Tundmatu ANN taust: {backend!r} (lubatud: {', '.join(ANN_BACKENDS)})")
+
+
+# ---------------------------------------------------------------------------
+# Mõõtmine: kataloogi suurus vs latentsus ja recall
+# ---------------------------------------------------------------------------
+
+def _synthetic(n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    """Klasterdatud sünteetilised vektorid (gaussi segu), sarnaselt päris tekstivektoritele."""
+    n_topics = max(8, int(math.sqrt(n)))
+    topics = rng.standard_normal((n_topics, dim)).astype(np.float32)
+    matrix = topics[rng.integers(0, n_topics, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def _replicated(n: int, base: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Päris vektorid korduvalt + väike müra (nagu mitme aasta kataloog)."""
+    rows = base[rng.integers(0, len(base), n)]
+    matrix = rows + 0.05 * rng.standard_normal(rows.shape).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def _measure(search, queries, k, mask, exact):
+    times, recalls = [], []
+    for q, truth in zip(queries, exact):
+        t0 = time.perf_counter()
+        positions, _ = search(q, k, mask)
+        times.append(time.perf_counter() - t0)
+        recalls.append(len(set(positions.tolist()) & truth) / max(1, len(truth)))
+    return np.percentile(times, 50) * 1000, np.percentile(times, 95) * 1000, float(np.mean(recalls))
+
+
+def sweep(sizes, dim: int = 256, n_queries: int = 200, k: int = 10, backends=ANN_BACKENDS,
+          nprobe: int = DEFAULT_NPROBE, mask_fraction: float = 0.1, replicate: bool = False, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    base = None
+    if replicate:
+        from benchmark import EMBEDDINGS_MANIFEST, EMBEDDINGS_NPY
+        from course_index import load_embedding_artifact
+
+        _, base = load_embedding_artifact(EMBEDDINGS_NPY, EMBEDDINGS_MANIFEST)
+        base = (base / np.linalg.norm(base, axis=1, keepdims=True)).astype(np.float32)
+        dim = base.shape[1]
+
+    print(f"{'N':>8} {'taust':<6} {'mask':<5} {'ehitus s':>9} {'p50 ms':>8} {'p95 ms':>8} {f'recall@{k}':>10}")
+    rows = []
+    for n in sizes:
+        matrix = _replicated(n, base, rng) if replicate else _synthetic(n, dim, rng)
+        queries = matrix[rng.integers(0, n, n_queries)] + 0.3 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        mask = rng.random(n) < mask_fraction
+
+        indexes = {"exact": (0.0, lambda q, kk, m: top_positions(matrix @ q, kk, m))}
+        for backend in backends:
+            t0 = time.perf_counter()
+            try:
+                params = {"nprobe": nprobe} if backend == "ivf" else {}
+                ann = build_ann(matrix, backend, **params)
+            except ImportError as e:
+                print(f"{n:>8} {backend:<6} – {e}")
+                continue
+            indexes[backend] = (time.perf_counter() - t0, ann.search)
+
+        for use_mask in (False, True):
+            m = mask if use_mask else None
+            exact = [set(top_positions(matrix @ q, k, m)[0].tolist()) for q in queries]
+            for name, (build_s, search) in indexes.items():
+                p50, p95, recall = _measure(search, queries, k, m, exact)
+                label = f"{mask_fraction:.0%}" if use_mask else "–"
+                print(f"{n:>8} {name:<6} {label:<5} {build_s:>9.2f} {p50:>8.3f} {p95:>8.3f} {recall:>10.1%}", flush=True)
+                rows.append({"n": n, "backend": name, "mask": use_mask, "build_s": build_s,
+                             "p50_ms": p50, "p95_ms": p95, "recall": recall})
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ANN indeksi mõõtmine kataloogi suuruse järgi")
+    parser.add_argument("--sizes", type=str, default="3000,30000,100000", help="Kataloogi suurused")
+    parser.add_argument("--dim", type=int, default=256, help="Sünteetiliste vektorite mõõde")
+    parser.add_argument("--queries", type=int, default=200, help="Päringute arv suuruse kohta")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="IVF: skooritavate klastrite arv")
+    parser.add_argument("--mask-fraction", type=float, default=0.1, help="Filtrimaski läbilaskvus")
+    parser.add_argument("--backends", type=str, default=",".join(ANN_BACKENDS))
+    parser.add_argument("--replicate", action="store_true",
+                        help="Kasuta data/ vektoreid (kordus + müra) sünteetiliste asemel")
+    args = parser.parse_args()
+
+    sweep([int(s) for s in args.sizes.split(",")], dim=args.dim, n_queries=args.queries, k=args.top_k,
+          backends=[b for b in args.backends.split(",") if b], nprobe=args.nprobe,
+          mask_fraction=args.mask_fraction, replicate=args.replicate)
@@ -0,0 +1,177 @@
+"""
+answer_cache.py – Semantiline vastuste vahemälu peaaegu samade küsimuste jaoks.
+
+"tahan õppida masinõpet" ja "soovin õppida masinõpet" annavad sama otsingu
+tulemuse ja sama vastuse, kuid kumbki maksab täis LLM-i genereerimise.
+Vahemälu asub pärast otsingut: vastus tuleb vahemälust, kui
+
+  1. päringuvektori koosinussarnasus mõne salvestatud päringuga >= threshold,
+  2. ulatus on sama: aktiivsete filtrite sõne, konteksti kursuste ID-d (samas
+     järjekorras), varasem vestlus ja mudel (answer_scope),
+  3. kirje pole vanem kui ttl_s ja kataloog pole vahepeal muutunud.
+
+Kataloogi muutumisel (catalog_version) tühjendatakse kogu vahemälu. Kirjeid on
+kuni max_items; täitumisel visatakse välja kõige kauem kasutamata kirje (LRU).
+
+    cache = AnswerCache(threshold=0.93)
+    scope = answer_scope(filters_str, context_ids, history, LLM_MODEL)
+    hit = cache.lookup(query_vec, scope, catalog_version())
+    ...
+    cache.put(query, query_vec, scope, answer, catalog_version())
+
+Vahemälu on protsessisisene (Streamliti seansid jagavad seda get_answer_cache()
+kaudu). Ilma päringuvektorita pöördeid (kursuse kood, BM25-režiim) ei puhverdata.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.93
+DEFAULT_TTL_S = 6 * 3600
+DEFAULT_MAX_ITEMS = 512
+
+
+def answer_scope(filters: str, context_ids: list[str], history: list[dict], model: str) -> str:
+    """
+    Räsi kõigest peale päringu, mis vastust mõjutab. history – varasemad
+    sõnumid (ilma süsteemiviiba ja praeguse päringuta).
+    """
+    payload = {
+        "filters": filters,
+        "context_ids": [str(cid) for cid in context_ids],
+        "history": [{"role": m["role"], "content": m["content"]} for m in history],
+        "model": model,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+@dataclass
+class CachedAnswer:
+    query: str                # päring, millele vastus algselt genereeriti
+    text: str
+    similarity: float         # sarnasus praeguse päringuga
+    age_s: float
+    hits: int                 # mitu korda kirjet on (koos selle korraga) kasutatud
+
+    def as_debug(self) -> dict:
+        return {"query": self.query, "similarity": round(self.similarity, 4),
+                "age_s": round(self.age_s, 1), "hits": self.hits}
+
+
+@dataclass
+class _Entry:
+    query: str
+    vector: np.ndarray
+    scope: str
+    text: str
+    created: float
+    hits: int = 0
+
+
+class AnswerCache:
+    """
+    threshold – minimaalne koosinussarnasus (päringuvektorid normeeritakse)
+    ttl_s     – kirje eluiga sekundites
+    max_items – kirjete arv; 0 lülitab vahemälu välja
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, ttl_s: float = DEFAULT_TTL_S,
+                 max_items: int = DEFAULT_MAX_ITEMS, clock=time.monotonic):
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self._clock = clock
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._next_id = 0
+        self._catalog_version: str | None = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "expired": 0, "invalidated": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_items > 0
+
+    # --- sisemised abimeetodid (lukk peab olema võetud) ---
+
+    def _check_catalog(self, catalog_version: str | None):
+        if catalog_version != self._catalog_version:
+            if self._entries:
+                self.stats["invalidated"] += len(self._entries)
+                self._entries.clear()
+            self._catalog_version = catalog_version
+
+    def _drop_expired(self, now: float):
+        expired = [key for key, e in self._entries.items() if now - e.created > self.ttl_s]
+        for key in expired:
+            del self._entries[key]
+        self.stats["expired"] += len(expired)
+
+    # --- avalik liides ---
+
+    def lookup(self, query_vec, scope: str, catalog_version: str | None = None) -> CachedAnswer | None:
+        """Kõige sarnasem sama ulatusega kirje, kui sarnasus >= threshold; muidu None."""
+        if not self.enabled:
+            return None
+        vector = _unit(query_vec)
+        with self._lock:
+            now = self._clock()
+            self._check_catalog(catalog_version)
+            self._drop_expired(now)
+            best_key, best_sim = None, self.threshold
+            for key, entry in self._entries.items():
+                if entry.scope != scope or entry.vector.shape != vector.shape:
+                    continue
+                sim = float(entry.vector @ vector)
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            entry.hits += 1
+            self.stats["hits"] += 1
+            return CachedAnswer(query=entry.query, text=entry.text, similarity=best_sim,
+                                age_s=now - entry.created, hits=entry.hits)
+
+    def put(self, query: str, query_vec, scope: str, text: str, catalog_version: str | None = None):
+        if not self.enabled or not text:
+            return
+        vector = _unit(query_vec)
+        with self._lock:
+            self._check_catalog(catalog_version)
+            self._entries[self._next_id] = _Entry(query, vector, scope, text, self._clock())
+            self._next_id += 1
+            self.stats["stored"] += 1
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats_summary(self) -> dict:
+        with self._lock:
+            s = dict(self.stats)
+            s["items"] = len(self._entries)
+        lookups = s["hits"] + s["misses"]
+        s["lookups"] = lookups
+        s["hit_rate"] = s["hits"] / lookups if lookups else 0.0
+        return s
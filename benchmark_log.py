@@ -0,0 +1,151 @@
+"""
+benchmark_log.py – Benchmarki jooksu kontrollpunktid JSONL-failina.
+
+Iga lõpetatud testjuhtum lisatakse kohe faili (üks JSON-rida, flush + fsync),
+nii et katkestus, Ctrl-C või API rike ei kaota juba makstud vastuseid.
+Esimene rida kirjeldab jooksu (seaded ja planeeritud testjuhtumite ID-d):
+
+    {"run": {"created": ..., "top_k": 5, "case_ids": ["3f2a...", ...], ...}}
+    {"case_id": "3f2a...", "indeks": 1, "päring": ..., ...}
+    ...
+
+Testjuhtumi ID (case_id) on räsi päringu tekstist, mitte sample() järjekorrast,
+seega leiab --resume valmis juhtumid ka siis, kui testjuhtumite järjekord muutub.
+Kokkuvõte ja CSV arvutatakse faili läbi voogedes (latest_rows), mitte mälus
+hoitud ridadest.
+
+LLM-i veaga lõppenud juhtumeid (llm_viga) ei loeta tehtuks: --resume proovib
+neid uuesti ja kordus lisab faili uue rea. latest_rows annab iga case_id kohta
+ainult viimase rea, nii et õnnestunud kordus asendab vearea.
+
+Paralleelses jooksus lisatakse read lõpetamise järjekorras; latest_rows annab
+need "indeks" järjekorras (mällu jäävad ainult reapositsioonid failis), nii et
+CSV ja trace on igal jooksul sama järjekorraga.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+LOG_SUFFIX = ".jsonl"
+
+
+def case_id(query: str) -> str:
+    """Stabiilne testjuhtumi ID: päringu teksti räsi (tühikud normaliseeritud)."""
+    normalized = " ".join(query.split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def _json_default(value):
+    # NumPy skalaarid (nt np.float32 skoorid) -> Python tüübid
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class BenchmarkLog:
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = meta
+        self._lock = threading.Lock()
+
+    @property
+    def run_name(self) -> str:
+        return os.path.basename(self.path)[:-len(LOG_SUFFIX)]
+
+    # --- loomine ja avamine ---
+
+    @classmethod
+    def create(cls, path: str, meta: dict) -> "BenchmarkLog":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = {"created": datetime.now().isoformat(timespec="seconds"), **meta}
+        with open(path, "x", encoding="utf-8") as f:
+            f.write(json.dumps({"run": meta}, ensure_ascii=False, default=_json_default) + "\n")
+        return cls(path, meta)
+
+    @classmethod
+    def open(cls, path: str) -> "BenchmarkLog":
+        """Avab olemasoleva jooksu jätkamiseks. Pooleli jäänud viimane rida lõigatakse ära."""
+        with open(path, "rb+") as f:
+            data_end = f.seek(0, os.SEEK_END)
+            # Krahh kirjutamise ajal: viimane rida ilma reavahetuseta -> eemalda
+            pos = data_end
+            while pos > 0:
+                f.seek(pos - 1)
+                if f.read(1) == b"\n":
+                    break
+                pos -= 1
+            if pos != data_end:
+                f.truncate(pos)
+            f.seek(0)
+            first = f.readline()
+        try:
+            meta = json.loads(first.decode("utf-8"))["run"]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"{path} ei ole benchmarki jooksu fail (esimene rida pole jooksu kirjeldus)")
+        return cls(path, meta)
+
+    # --- kirjutamine ja lugemine ---
+
+    def append(self, row: dict):
+        line = json.dumps(row, ensure_ascii=False, default=_json_default) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _rows_with_offsets(self):
+        """(rea algus failis baitides, rida) faili järjekorras; vigased read jäetakse vahele."""
+        with open(self.path, "rb") as f:
+            f.readline()
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                try:
+                    yield offset, json.loads(line.decode("utf-8"))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    continue
+
+    def iter_rows(self):
+        """Voogedastab tulemusread faili järjekorras (jooksu kirjeldus jäetakse vahele)."""
+        for _, row in self._rows_with_offsets():
+            yield row
+
+    def latest_rows(self):
+        """
+        Iga case_id kohta ainult viimane rida (kordus asendab varasema), "indeks"
+        järjekorras. Esimesel läbimisel jäetakse meelde ainult reapositsioonid,
+        read loetakse teisel läbimisel ükshaaval.
+        """
+        last = {}
+        for n, (offset, row) in enumerate(self._rows_with_offsets()):
+            last[row.get("case_id", n)] = (row.get("indeks") or 0, n, offset)
+        with open(self.path, "rb") as f:
+            for _, _, offset in sorted(last.values()):
+                f.seek(offset)
+                yield json.loads(f.readline().decode("utf-8"))
+
+    def completed_ids(self) -> set[str]:
+        """Juhtumid, mille viimane rida lõppes ilma LLM-i veata."""
+        latest = {}
+        for row in self.iter_rows():
+            if "case_id" in row:
+                latest[row["case_id"]] = not row.get("llm_viga")
+        return {cid for cid, ok in latest.items() if ok}
+
+
+def resolve_run(run: str, results_dir: str) -> str:
+    """--resume argument: failitee või jooksu nimi RESULTS_DIR kaustas (laiendiga või ilma)."""
+    candidates = [run, run + LOG_SUFFIX, os.path.join(results_dir, run),
+                  os.path.join(results_dir, run + LOG_SUFFIX)]
+    for path in candidates:
+        if path.endswith(LOG_SUFFIX) and os.path.isfile(path):
+            return path
+    raise SystemExit(f"❌ Jooksu {run!r} ei leitud (otsiti ka kaustast {results_dir}/).")
@@ -0,0 +1,216 @@
+"""
+build_embeddings.py – Kursuste vektorite ehitamine puhtad_andmed.csv failist.
+
+Väljund:
+    data/puhtad_andmed_embeddings.npy            float32 maatriks (N x D)
+    data/puhtad_andmed_embeddings_manifest.json  mudel, mõõde ning iga rea
+                                                 unique_ID ja sisu räsi
+
+Kordusehitusel manustatakse uuesti ainult read, mille sisu räsi on muutunud
+(või mis on uued); ülejäänud vektorid võetakse eelmisest artefaktist.
+
+Käivitamine:
+    python build_embeddings.py                       # inkrementaalne ehitus
+    python build_embeddings.py --batch-size 64
+    python build_embeddings.py --full                # manusta kõik read uuesti
+    python build_embeddings.py --import-pkl data/puhtad_andmed_embeddings.pkl
+                                                     # vana pickle -> uus formaat
+    python build_embeddings.py --import-pkl data/puhtad_andmed_embeddings.pkl \
+        --text-columns nimi_et,kirjeldus             # pickle'i teksti veerud teada
+
+Imporditud pickle'i tekstiretsept pole teada: ilma --text-columns'ita saavad
+read räsiks IMPORTED_HASH ja manifesti text_columns on null, nii et järgmine
+ehitus manustab need uuesti (seni kasutab rakendus imporditud vektoreid).
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmark import COURSES_CSV, EMBEDDINGS_NPY, EMBEDDINGS_MANIFEST, EMBEDDING_MODEL
+
+# Veerud, millest koostatakse manustatav tekst (järjekord on oluline räsi jaoks)
+TEXT_COLUMNS = ["nimi_et", "nimi_en", "kirjeldus", "opivaljundid", "oppeaste", "keel"]
+# Tundmatu retseptiga (imporditud) rea räsi; ei lange kokku ühegi content_hash'iga
+IMPORTED_HASH = "imported"
+
+
+def course_text(row: pd.Series, columns: list[str] = TEXT_COLUMNS) -> str:
+    """Koondab kursuse tekstiväljad kujule 'veerg: väärtus' (üks rida veeru kohta)."""
+    parts = []
+    for col in columns:
+        if col in row and pd.notna(row[col]):
+            parts.append(f"{col}: {row[col]}")
+    return "\n".join(parts)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def load_manifest(manifest_path: str = EMBEDDINGS_MANIFEST) -> dict | None:
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_artifact(matrix: np.ndarray, manifest: dict, npy_path: str, manifest_path: str):
+    """Kirjutab artefakti atomaarselt (ajutine fail + os.replace)."""
+    os.makedirs(os.path.dirname(npy_path) or ".", exist_ok=True)
+    tmp_npy = npy_path + ".tmp.npy"
+    np.save(tmp_npy, np.ascontiguousarray(matrix, dtype=np.float32))
+    tmp_manifest = manifest_path + ".tmp"
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_npy, npy_path)
+    os.replace(tmp_manifest, manifest_path)
+
+
+def _manifest_for(ids: list[str], hashes: list[str], dim: int,
+                  text_columns: list[str] | None = TEXT_COLUMNS) -> dict:
+    return {
+        "model": EMBEDDING_MODEL,
+        "dim": dim,
+        "text_columns": text_columns,
+        "built_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "rows": [{"unique_ID": i, "hash": h} for i, h in zip(ids, hashes)],
+    }
+
+
+def build_embeddings(courses_csv: str = COURSES_CSV,
+                     npy_path: str = EMBEDDINGS_NPY,
+                     manifest_path: str = EMBEDDINGS_MANIFEST,
+                     batch_size: int = 32,
+                     full: bool = False,
+                     embedder=None) -> dict:
+    """
+    Ehitab (või uuendab) vektorite artefakti. Tagastab statistika sõnastiku.
+    embedder – valikuline juba laaditud SentenceTransformer.
+    """
+    df = pd.read_csv(courses_csv)
+    df = df.drop_duplicates(subset="unique_ID").reset_index(drop=True)
+    ids = df["unique_ID"].astype(str).tolist()
+    texts = [course_text(row) for _, row in df.iterrows()]
+    hashes = [content_hash(t) for t in texts]
+
+    # --- Eelmise artefakti taaskasutus ---
+    reuse = {}
+    old_matrix = None
+    manifest = None if full else load_manifest(manifest_path)
+    if manifest and manifest.get("model") == EMBEDDING_MODEL and manifest.get("text_columns") == TEXT_COLUMNS \
+            and os.path.isfile(npy_path):
+        old_matrix = np.load(npy_path, mmap_mode="r")
+        for pos, entry in enumerate(manifest["rows"]):
+            reuse[entry["unique_ID"]] = (entry["hash"], pos)
+
+    todo = [i for i, (cid, h) in enumerate(zip(ids, hashes)) if reuse.get(cid, (None,))[0] != h]
+    print(f"Kursusi: {len(ids)}, taaskasutatakse: {len(ids) - len(todo)}, manustatakse: {len(todo)}", flush=True)
+
+    new_vectors = {}
+    elapsed = 0.0
+    if todo:
+        if embedder is None:
+            from sentence_transformers import SentenceTransformer
+            print(f"Laen mudelit {EMBEDDING_MODEL} ...", flush=True)
+            embedder = SentenceTransformer(EMBEDDING_MODEL)
+
+        t0 = time.perf_counter()
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            vectors = embedder.encode([texts[i] for i in batch], batch_size=batch_size)
+            for i, vec in zip(batch, vectors):
+                new_vectors[i] = np.asarray(vec, dtype=np.float32)
+            done = start + len(batch)
+            elapsed = time.perf_counter() - t0
+            print(f"  {done}/{len(todo)} rida  ({done / elapsed:.1f} rida/s)", flush=True)
+
+    if new_vectors:
+        dim = len(next(iter(new_vectors.values())))
+    elif old_matrix is not None:
+        dim = old_matrix.shape[1]
+    else:
+        raise ValueError(f"{courses_csv}: kataloogis pole ühtegi kursust ja eelmist artefakti pole")
+    matrix = np.empty((len(ids), dim), dtype=np.float32)
+    for i, cid in enumerate(ids):
+        if i in new_vectors:
+            matrix[i] = new_vectors[i]
+        else:
+            matrix[i] = old_matrix[reuse[cid][1]]
+
+    _write_artifact(matrix, _manifest_for(ids, hashes, dim), npy_path, manifest_path)
+
+    rows_per_s = len(todo) / elapsed if elapsed else 0.0
+    print(f"Salvestatud: {npy_path} ({matrix.shape[0]} x {dim}), {manifest_path}", flush=True)
+    if todo:
+        print(f"Manustamise kiirus: {rows_per_s:.1f} rida/s ({elapsed:.1f} s)", flush=True)
+    return {
+        "rows": len(ids),
+        "embedded": len(todo),
+        "reused": len(ids) - len(todo),
+        "seconds": elapsed,
+        "rows_per_s": rows_per_s,
+    }
+
+
+def import_pickle(pkl_path: str,
+                  courses_csv: str = COURSES_CSV,
+                  npy_path: str = EMBEDDINGS_NPY,
+                  manifest_path: str = EMBEDDINGS_MANIFEST,
+                  text_columns: list[str] | None = None):
+    """
+    Teisendab vana (unique_ID, embedding) pickle'i uude formaati.
+    text_columns – veerud, millest pickle'i vektorid manustati. Kui need on
+    teada, arvutatakse räsid praegusest CSV-st nende järgi; muidu saavad read
+    räsiks IMPORTED_HASH ja järgmine build_embeddings() manustab need uuesti.
+    """
+    embeddings_df = pd.read_pickle(pkl_path).drop_duplicates(subset="unique_ID")
+    df = pd.read_csv(courses_csv).drop_duplicates(subset="unique_ID")
+    merged = pd.merge(df, embeddings_df[["unique_ID", "embedding"]], on="unique_ID")
+    if merged.empty:
+        raise ValueError(f"{pkl_path}: ükski vektor ei vasta kataloogi {courses_csv} kursustele")
+    ids = merged["unique_ID"].astype(str).tolist()
+    if text_columns:
+        hashes = [content_hash(course_text(row, text_columns)) for _, row in merged.iterrows()]
+    else:
+        hashes = [IMPORTED_HASH] * len(ids)
+    matrix = np.stack(merged["embedding"].values).astype(np.float32)
+    manifest = _manifest_for(ids, hashes, matrix.shape[1], text_columns or None)
+    _write_artifact(matrix, manifest, npy_path, manifest_path)
+    print(f"Imporditud {len(ids)} vektorit: {npy_path}, {manifest_path}")
+    if not text_columns:
+        print("Teksti veerud pole teada (--text-columns): järgmine ehitus manustab read uuesti")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kursuste vektorite ehitamine")
+    parser.add_argument("--csv", type=str, default=COURSES_CSV, help="Kursuste CSV")
+    parser.add_argument("--batch-size", type=int, default=32, help="Manustamise partii suurus")
+    parser.add_argument("--full", action="store_true", help="Ignoreeri eelmist artefakti")
+    parser.add_argument("--import-pkl", type=str, default=None,
+                        help="Teisenda olemasolev embeddings-pickle uude formaati")
+    parser.add_argument("--text-columns", type=str, default=None,
+                        help="Komadega eraldatud veerud, millest pickle'i vektorid manustati "
+                             f"(nt {','.join(TEXT_COLUMNS)}); vaikimisi tundmatu")
+    args = parser.parse_args()
+
+    if args.import_pkl:
+        text_columns = [c.strip() for c in args.text_columns.split(",") if c.strip()] if args.text_columns else None
+        import_pickle(args.import_pkl, courses_csv=args.csv, text_columns=text_columns)
+    else:
+        build_embeddings(courses_csv=args.csv, batch_size=args.batch_size, full=args.full)
+
+    # Veerupõhine kataloog rakendusele ja benchmarkile (catalog_store.py), CSV kõrvale
+    from catalog_store import build_catalog
+
+    catalog_path = os.path.splitext(args.csv)[0] + ".feather"
+    try:
+        catalog = build_catalog(args.csv, catalog_path)
+        print(f"Kataloog: {catalog_path} ({catalog['rows']} rida, {catalog['bytes'] / 1e6:.1f} MB)")
+    except RuntimeError as e:
+        print(f"⚠️  Kataloogi Feather-faili ei ehitatud: {e}")
@@ -0,0 +1,370 @@
+"""
+catalog_cleaning.py – Kursuste toorandmete puhastamine (notebooks/andmete_puhastamine.ipynb skriptina).
+
+Sisend:  data/toorandmed_aasta.csv  (ÕIS-i toorandmete eksport)
+Väljund: data/andmed_aasta.csv      (sama sisuga kui märkmiku väljund, bait-baidilt)
+
+Märkmik loeb kogu faili korraga (low_memory=False) ja teeb JSON-veergudel
+reahaaval apply() kutsed. Siin:
+    1. dtype-skann: loetakse tükkidena ainult vajalikud veerud ja leitakse iga
+       veeru tüüp nii, nagu pandas selle kogu faili lugemisel järeldaks
+       (muidu võiks nt eap olla ühes tükis "6" ja teises "6.0");
+    2. puhastamine: tükid (chunksize rida) lähevad töötajaprotsessidesse
+       (filtreerimine, veergude ühendamine, JSON-väljade parsimine);
+    3. kirjutamine: tulemused kirjutatakse järjekorras ajutisse faili, mis
+       lõpus nimetatakse väljundiks. Mälus on korraga kuni 2 × workers tükki.
+
+Käivitamine:
+    python catalog_cleaning.py
+    python catalog_cleaning.py --input data/toorandmed_2024.csv --output data/andmed_2024.csv
+    python catalog_cleaning.py --chunksize 2000 --workers 4
+    python catalog_cleaning.py --output /tmp/uus.csv --check data/andmed_aasta.csv
+                                              # võrdle märkmiku väljundiga
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import resource
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype
+
+# ---------------------------------------------------------------------------
+# Konfiguratsioon
+# ---------------------------------------------------------------------------
+INPUT_FILE = os.path.join("data", "toorandmed_aasta.csv")
+OUTPUT_FILE = os.path.join("data", "andmed_aasta.csv")
+DEFAULT_CHUNKSIZE = 5000
+
+# Ained, mis pole kaitsmisega seotud ega kompleksained ja mille kestus on 1 semester
+TARGET_TYPES = ["regular", "practice"]
+
+# (uus nimi, üldise info veerg, versiooni info veerg) – eelistatakse versiooni infot
+MERGE_MAPPING = [
+    ("nimi_et", "title__et", "version__title__et"),
+    ("eap", "credits", "version__credits"),
+    ("kirjeldus", "overview__description__et", "version__overview__description__et"),
+    ("opivaljundid", "overview__learning_outcomes_text_et", "version__overview__learning_outcomes_text_et"),
+]
+
+# (uus nimi, vana nimi)
+RENAME_MAPPING = [
+    ("aine_kood", "code"),
+    ("semester", "version__target__semester__et"),
+    ("oppejoud_json", "version__participants__lecturers"),
+    ("toimumisajad_json", "version__schedule__entries"),
+    ("keel", "version__target__language__et"),
+    ("hindamisskaala", "additional_info__assessment_scale__et"),
+    ("asukoht", "version__target__course_main_structural_unit__city"),
+    ("oppeaste_json", "version__additional_info__study_levels"),
+    ("hindmaismeetod", "version__grading__grade_evaluation__et"),
+    ("miinimumnouded", "version__grading__grade_preconditions__et"),
+]
+
+FILTER_COLUMNS = ["additional_info__duration_in_semesters", "general__type__code"]
+PREREQUISITES_COLUMN = "additional_info__prerequisites"
+
+FINAL_COLS = [
+    "aine_kood", "nimi_et", "nimi_en", "eap", "semester",
+    "kirjeldus", "hindamine_info", "toimumisajad", "oppejoud",
+    "opivaljundid", "keel", "hindamisskaala", "asukoht",
+    "oppeaste", "hindmaismeetod", "miinimumnouded", "eeldusained",
+]
+
+DAY_MAP = {
+    "Monday": "Esmaspäev", "Tuesday": "Teisipäev", "Wednesday": "Kolmapäev",
+    "Thursday": "Neljapäev", "Friday": "Reede", "Saturday": "Laupäev", "Sunday": "Pühapäev",
+}
+WEEK_ORDER = ["Esmaspäev", "Teisipäev", "Kolmapäev", "Neljapäev", "Reede", "Laupäev", "Pühapäev"]
+
+
+def source_columns() -> list[str]:
+    """Toorandmete veerud, mida puhastamine kasutab (ülejäänuid ei loeta)."""
+    cols = list(FILTER_COLUMNS)
+    for _, base, version in MERGE_MAPPING:
+        cols += [base, version]
+    cols += [source for _, source in RENAME_MAPPING]
+    cols.append(PREREQUISITES_COLUMN)
+    # Toorandmetes samanimelised veerud (nt nimi_en, hindamine_info) lähevad väljundisse muutmata
+    cols += FINAL_COLS
+    return list(dict.fromkeys(cols))
+
+
+# ---------------------------------------------------------------------------
+# JSON väljade parsimine (samad reeglid nagu märkmikus)
+# ---------------------------------------------------------------------------
+
+def parse_json_safe(json_str):
+    """
+    Teisendab JSON-stringi turvaliselt Pythoni objektiks (list või dict).
+    Käsitleb tühje väärtusi (NaN, None) ja katkist JSON-it, tagastades vea korral None.
+    """
+    if pd.isna(json_str) or json_str == "":
+        return None
+    try:
+        return json.loads(json_str)
+    except (json.JSONDecodeError, TypeError):
+        return None
+
+
+def extract_lecturers(json_str):
+    """Õppejõudude nimed ('person_name'): unikaalsed, tähestikulises järjekorras, komadega."""
+    data = parse_json_safe(json_str)
+    if not data:
+        return None
+    names = [p.get("person_name") for p in data if isinstance(p, dict) and p.get("person_name")]
+    return ", ".join(sorted(set(names))) if names else None
+
+
+@lru_cache(maxsize=65536)
+def _day_name_et(time_str):
+    # pd.to_datetime on üksikväärtusel aeglane, tunniplaani ajad korduvad palju
+    dt = pd.to_datetime(time_str, errors="coerce")
+    if pd.isna(dt):
+        return None
+    en_day = dt.day_name()
+    return DAY_MAP.get(en_day, en_day)
+
+
+def extract_schedule_days_et(json_str):
+    """Nädalapäevad, millal aine toimub, eesti keeles ja nädala järjekorras (Esmaspäev ... Pühapäev)."""
+    data = parse_json_safe(json_str)
+    if not data:
+        return None
+
+    days = set()
+    for entry in data:
+        if not isinstance(entry, dict):
+            continue
+        time_str = entry.get("time") or entry.get("start_time")
+        if time_str:
+            day = _day_name_et(time_str) if isinstance(time_str, (str, int, float)) else None
+            if day is not None:
+                days.add(day)
+
+    sorted_days = sorted(days, key=lambda d: WEEK_ORDER.index(d) if d in WEEK_ORDER else 99)
+    return ", ".join(sorted_days) if sorted_days else None
+
+
+def extract_study_levels_et(json_str):
+    """Õppeastmed ('et'): unikaalsed, tähestikulises järjekorras, komadega."""
+    data = parse_json_safe(json_str)
+    if not data:
+        return None
+    values = [item.get("et") for item in data if isinstance(item, dict) and item.get("et")]
+    return ", ".join(sorted(set(values))) if values else None
+
+
+def extract_prerequisites(json_str):
+    """Eeldusained kujul "LTAT.01.001 Programmeerimine, MTAT.03.100 Andmebaasid"."""
+    data = parse_json_safe(json_str)
+    if not data:
+        return None
+    try:
+        # Puhastame stringi, kui seal on topelt-jutumärke (faili eripära)
+        data = json.loads(json_str.replace('""', '"'))
+        res = []
+        for item in data:
+            code = item.get("code", "")
+            name = item.get("title", {}).get("et", "")
+            if code and name:
+                res.append(f"{code} {name}")
+            elif code:
+                res.append(code)
+        return ", ".join(res) if res else None
+    except Exception:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Ühe tüki puhastamine (töötajaprotsessis)
+# ---------------------------------------------------------------------------
+
+def resolve_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """Lisab puhtad veerud, eelistades versioonipõhist infot (märkmiku samm 2)."""
+    for new_col, base, version in MERGE_MAPPING:
+        base_exists = base in df.columns
+        ver_exists = version in df.columns
+        if base_exists and ver_exists:
+            df[new_col] = df[version].fillna(df[base])
+        elif ver_exists:
+            df[new_col] = df[version]
+        elif base_exists:
+            df[new_col] = df[base]
+        else:
+            df[new_col] = np.nan
+    for new_col, source in RENAME_MAPPING:
+        df[new_col] = df[source] if source in df.columns else np.nan
+    return df
+
+
+def clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Toorandmete tükk -> puhastatud read (märkmiku sammud 1–5)."""
+    df = df[(df["additional_info__duration_in_semesters"] == 1) & (df["general__type__code"].isin(TARGET_TYPES))]
+    df = resolve_fields(df.copy())
+    df["oppejoud"] = df["oppejoud_json"].apply(extract_lecturers)
+    df["toimumisajad"] = df["toimumisajad_json"].apply(extract_schedule_days_et)
+    df["oppeaste"] = df["oppeaste_json"].apply(extract_study_levels_et)
+    prerequisites = df[PREREQUISITES_COLUMN] if PREREQUISITES_COLUMN in df.columns else pd.Series(np.nan, index=df.index)
+    df["eeldusained"] = prerequisites.apply(extract_prerequisites)
+    return df[[c for c in FINAL_COLS if c in df.columns]].copy()
+
+
+def _clean_chunk(chunk: pd.DataFrame) -> tuple[pd.DataFrame, int, float]:
+    t0 = time.perf_counter()
+    cleaned = clean_frame(chunk)
+    return cleaned, len(chunk), time.perf_counter() - t0
+
+
+# ---------------------------------------------------------------------------
+# dtype-skann ja torujuhe
+# ---------------------------------------------------------------------------
+
+def _merge_dtype(a, b):
+    """Kahe tüki veerutüüp -> tüüp, mille pandas annaks kogu veerule."""
+    if a == b:
+        return a
+    numeric = [t for t in (a, b) if (is_integer_dtype(t) or is_float_dtype(t)) and not is_bool_dtype(t)]
+    if len(numeric) == 2:
+        return np.dtype("float64")
+    return str
+
+
+def scan_dtypes(path: str, usecols: list[str], chunksize: int = DEFAULT_CHUNKSIZE) -> tuple[dict, int]:
+    """
+    Loeb vajalikud veerud tükkidena ja tagastab ({veerg: dtype}, ridade arv).
+    Arvulised ja tõeväärtusveerud saavad sama tüübi nagu low_memory=False lugemisel,
+    ülejäänud loetakse sõnedena (nagu pandas segatüüpi veeru puhul teeb).
+    """
+    dtypes: dict = {}
+    n_rows = 0
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+        n_rows += len(chunk)
+        for col, dtype in chunk.dtypes.items():
+            dtypes[col] = _merge_dtype(dtypes[col], dtype) if col in dtypes else dtype
+    resolved = {}
+    for col, dtype in dtypes.items():
+        numeric_or_bool = dtype is not str and (is_integer_dtype(dtype) or is_float_dtype(dtype) or is_bool_dtype(dtype))
+        resolved[col] = dtype if numeric_or_bool else str
+    return resolved, n_rows
+
+
+def clean_catalog(input_path: str = INPUT_FILE, output_path: str = OUTPUT_FILE,
+                  chunksize: int = DEFAULT_CHUNKSIZE, workers: int | None = None,
+                  verbose: bool = True) -> dict:
+    """
+    Puhastab toorandmed tükkide kaupa ja kirjutab väljundi järk-järgult.
+    Tagastab statistika: read sisse/välja, tükid, etappide ajad (s) ja mälu tipp.
+    """
+    if not os.path.exists(input_path):
+        raise FileNotFoundError(f"Sisendfaili '{input_path}' ei leitud! Kontrolli failiteed.")
+    workers = workers or os.cpu_count() or 1
+    timings = {"scan": 0.0, "read": 0.0, "clean": 0.0, "clean_cpu": 0.0, "write": 0.0}
+    t_start = time.perf_counter()
+
+    header = pd.read_csv(input_path, nrows=0).columns
+    missing = [c for c in FILTER_COLUMNS if c not in header]
+    if missing:
+        raise ValueError(f"Toorandmetes puuduvad filtriveerud: {', '.join(missing)}")
+    usecols = [c for c in source_columns() if c in header]
+
+    t0 = time.perf_counter()
+    dtypes, n_rows = scan_dtypes(input_path, usecols, chunksize)
+    timings["scan"] = time.perf_counter() - t0
+    if verbose:
+        print(f"Toorandmed: {n_rows} rida, {len(header)} veergu (kasutatakse {len(usecols)}).", flush=True)
+
+    stats = {"rows_in": 0, "rows_out": 0, "chunks": 0}
+    tmp_path = output_path + ".tmp"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as out:
+            def write(result):
+                cleaned, n_in, clean_s = result
+                t = time.perf_counter()
+                cleaned.to_csv(out, index=False, header=stats["chunks"] == 0)
+                timings["write"] += time.perf_counter() - t
+                timings["clean_cpu"] += clean_s
+                stats["rows_in"] += n_in
+                stats["rows_out"] += len(cleaned)
+                stats["chunks"] += 1
+                if verbose:
+                    print(f"  [{stats['rows_in']}/{n_rows}] puhastatud {stats['rows_out']} rida", flush=True)
+
+            reader = pd.read_csv(input_path, usecols=usecols, dtype=dtypes, chunksize=chunksize)
+            in_flight: deque = deque()
+            t_clean = time.perf_counter()
+            while True:
+                t = time.perf_counter()
+                chunk = next(reader, None)
+                timings["read"] += time.perf_counter() - t
+                if chunk is None:
+                    break
+                if pool is None:
+                    write(_clean_chunk(chunk))
+                    continue
+                in_flight.append(pool.submit(_clean_chunk, chunk))
+                # Piiratud mälu: kuni 2 tükki töötaja kohta on korraga töös
+                while len(in_flight) >= 2 * workers:
+                    write(in_flight.popleft().result())
+            while in_flight:
+                write(in_flight.popleft().result())
+            if stats["chunks"] == 0:
+                # Tühi sisend: ainult päis, nagu märkmikus
+                clean_frame(pd.read_csv(input_path, usecols=usecols, dtype=dtypes, nrows=0)).to_csv(out, index=False)
+            timings["clean"] = time.perf_counter() - t_clean - timings["read"] - timings["write"]
+        os.replace(tmp_path, output_path)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    stats["timings"] = timings
+    stats["total_s"] = time.perf_counter() - t_start
+    stats["workers"] = workers
+    # ru_maxrss on Linuxis kilobaitides
+    stats["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return stats
+
+
+def report_lines(stats: dict) -> list[str]:
+    t = stats["timings"]
+    return [
+        f"Ridu sisse / välja:  {stats['rows_in']} / {stats['rows_out']}  ({stats['chunks']} tükki, {stats['workers']} töötajat)",
+        f"dtype-skann:         {t['scan']:.2f} s",
+        f"Lugemine:            {t['read']:.2f} s",
+        f"Puhastamine:         {t['clean']:.2f} s  (töötajate CPU kokku {t['clean_cpu']:.2f} s)",
+        f"Kirjutamine:         {t['write']:.2f} s",
+        f"Kokku:               {stats['total_s']:.2f} s",
+        f"Mälu tipp (RSS):     {stats['peak_rss_mb']:.0f} MB (põhiprotsess)",
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kursuste toorandmete puhastamine (andmete_puhastamine.ipynb)")
+    parser.add_argument("--input", type=str, default=INPUT_FILE)
+    parser.add_argument("--output", type=str, default=OUTPUT_FILE)
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Ridu tüki kohta")
+    parser.add_argument("--workers", type=int, default=None, help="Töötajaprotsesse (vaikimisi CPU-de arv)")
+    parser.add_argument("--check", type=str, default=None, metavar="CSV",
+                        help="Võrdle väljundit viitefailiga (nt märkmiku väljund) bait-baidilt")
+    args = parser.parse_args()
+
+    stats = clean_catalog(args.input, args.output, chunksize=args.chunksize, workers=args.workers)
+    print("=" * 60)
+    for line in report_lines(stats):
+        print(line)
+    print("=" * 60)
+    if args.check:
+        same = filecmp.cmp(args.output, args.check, shallow=False)
+        print(f"Võrdlus {args.check}: {'identne ✅' if same else 'ERINEB ❌'}")
+        raise SystemExit(0 if same else 1)
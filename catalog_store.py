@@ -0,0 +1,307 @@
+"""
+catalog_store.py – Kursuste kataloog veerupõhises Feather (Arrow IPC) failis.
+
+puhtad_andmed.csv parsimine igal käivitamisel annab ainult objekt-sõnedega
+veerud. Kataloogi ehitusel (build_embeddings.py või `python catalog_store.py`)
+kirjutatakse lisaks:
+
+    data/puhtad_andmed.feather   tihendamata Arrow IPC; filtriveerud
+                                 (FACET_COLUMNS) kategooriatena, eap float32-na
+
+Rakendus ja benchmark loevad sealt ainult vajalikud veerud (CORE_COLUMNS).
+Pikad tekstiväljad (TEXT_COLUMNS) loetakse memory-mapitud failist alles siis,
+kui neid vaja on (LazyText: ainult top-k tulemuste read konteksti jaoks).
+Kui CSV on Feather-failist uuem, ehitatakse see automaatselt uuesti; kui
+pyarrow puudub, loetakse endiselt CSV.
+
+    catalog, text = open_catalog()             # põhiveerud + LazyText
+    results = text.attach(catalog.iloc[[3, 7]])
+
+Laadimisaja ja mälu võrdlus (CSV vs Feather, eraldi protsessides):
+    python catalog_store.py --report
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmark import COURSES_CSV, DATA_DIR
+
+CATALOG_FEATHER = os.path.join(DATA_DIR, "puhtad_andmed.feather")
+FORMAT_VERSION = 1
+METADATA_KEY = b"ois_catalog"
+
+# Külgriba filtrid ja keel: väike arv erinevaid väärtusi -> kategooria
+FACET_COLUMNS = ["semester", "linn", "oppeaste", "veebiope", "hindamisviis", "keel"]
+# Pikad vabatekstid: ei loeta käivitusel, vaid tulemuste ridadele (LazyText)
+TEXT_COLUMNS = ["kirjeldus", "opivaljundid", "hindmaismeetod", "miinimumnouded", "oppejoud", "toimumisajad"]
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute  # noqa: F401
+        import pyarrow.feather  # noqa: F401
+        return pyarrow
+    except ImportError:
+        return None
+
+
+def _source_stamp(csv_path: str) -> dict:
+    st = os.stat(csv_path)
+    return {"csv_size": st.st_size, "csv_mtime_ns": st.st_mtime_ns, "version": FORMAT_VERSION}
+
+
+def catalog_version(csv_path: str = COURSES_CSV) -> str | None:
+    """Kataloogi CSV versioon (suurus ja mtime); muutub, kui kataloogi uuendatakse."""
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return None
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+# ---------------------------------------------------------------------------
+# Ehitamine
+# ---------------------------------------------------------------------------
+
+def typed_catalog(df: pd.DataFrame) -> pd.DataFrame:
+    """Filtriveerud kategooriateks, eap float32-ks (kui see on kadudeta)."""
+    df = df.copy()
+    for col in FACET_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    if "eap" in df.columns:
+        eap = pd.to_numeric(df["eap"], errors="coerce")
+        compact = eap.astype(np.float32)
+        # float32 ainult siis, kui iga väärtus taastub täpselt (filtrite võrdlused jäävad samaks)
+        same = (compact.astype(np.float64) == eap) | eap.isna()
+        df["eap"] = compact if bool(same.all()) else eap
+    return df
+
+
+def build_catalog(csv_path: str = COURSES_CSV, path: str = CATALOG_FEATHER) -> dict:
+    """Kirjutab CSV-st tüübitud Feather-faili; tagastab {"rows", "columns", "bytes", "seconds"}."""
+    pa = _pyarrow()
+    if pa is None:
+        raise RuntimeError("pyarrow puudub: pip install pyarrow")
+    t0 = time.perf_counter()
+    df = typed_catalog(pd.read_csv(csv_path))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps(_source_stamp(csv_path)).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    # Unikaalne ajutine fail: soojenduslõim ja teised lugejad võivad ehitada samal ajal
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        # Tihendamata: memory_map lugemine ei pea midagi lahti pakkima
+        pa.feather.write_feather(table, tmp_path, compression="uncompressed")
+        shutil.copymode(csv_path, tmp_path)  # NamedTemporaryFile loob faili õigustega 0600; võta CSV omad
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return {"rows": len(df), "columns": len(df.columns), "bytes": os.path.getsize(path),
+            "seconds": time.perf_counter() - t0}
+
+
+def _is_fresh(csv_path: str, path: str) -> bool:
+    pa = _pyarrow()
+    if pa is None or not os.path.exists(path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    try:
+        with pa.memory_map(path) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        return json.loads(metadata.get(METADATA_KEY, b"{}")) == _source_stamp(csv_path)
+    except (OSError, ValueError, pa.ArrowInvalid):
+        return False
+
+
+def ensure_catalog(csv_path: str = COURSES_CSV, path: str = CATALOG_FEATHER) -> bool:
+    """True, kui Feather-fail on olemas ja CSV-ga kooskõlas (vajadusel ehitab uuesti)."""
+    if _is_fresh(csv_path, path):
+        return True
+    if _pyarrow() is None or not os.path.exists(csv_path):
+        return False
+    try:
+        build_catalog(csv_path, path)
+    except OSError as e:
+        print(f"⚠️  Kataloogi Feather-faili ei saanud kirjutada ({e}), loen CSV-d.", flush=True)
+        return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Lugemine
+# ---------------------------------------------------------------------------
+
+def load_catalog(columns: list[str] | None = None, csv_path: str = COURSES_CSV,
+                 path: str = CATALOG_FEATHER) -> pd.DataFrame:
+    """Kataloog (või ainult columns veerud, mis failis olemas) Feather-failist, varuvariandina CSV-st."""
+    if ensure_catalog(csv_path, path):
+        pa = _pyarrow()
+        if columns is not None:
+            with pa.memory_map(path) as source:
+                names = pa.ipc.open_file(source).schema.names
+            columns = [c for c in columns if c in names]
+        return pa.feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    usecols = (lambda c: c in columns) if columns is not None else None
+    return typed_catalog(pd.read_csv(csv_path, usecols=usecols))
+
+
+class LazyText:
+    """
+    TEXT_COLUMNS Feather-failist unique_ID järgi. Tabel memory-mapitakse
+    esimesel kasutamisel; pandas'isse teisendatakse ainult küsitud read.
+    """
+
+    def __init__(self, path: str, column_order: list[str]):
+        self.path = path
+        self.column_order = column_order
+        self.columns = [c for c in column_order if c in TEXT_COLUMNS]
+        self._table = None
+        self._rows: dict[str, int] | None = None
+
+    def _load(self):
+        if self._table is None:
+            pa = _pyarrow()
+            table = pa.feather.read_table(self.path, columns=["unique_ID"] + self.columns, memory_map=True)
+            self._rows = {str(cid): i for i, cid in enumerate(table.column("unique_ID").to_pylist())}
+            self._table = table.drop_columns(["unique_ID"])
+        return self._table
+
+    def fetch(self, ids) -> pd.DataFrame:
+        """Tekstiveerud antud ID-de jaoks samas järjekorras (tundmatu ID -> NaN)."""
+        table = self._load()
+        rows = [self._rows.get(str(cid), -1) for cid in ids]
+        found = [r for r in rows if r >= 0]
+        fetched = table.take(found).to_pandas()
+        if len(found) == len(rows):
+            return fetched
+        out = pd.DataFrame(index=range(len(rows)), columns=self.columns, dtype=object)
+        out.loc[[i for i, r in enumerate(rows) if r >= 0]] = fetched.to_numpy()
+        return out
+
+    def attach(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Lisab df ridadele tekstiveerud; veergude järjekord nagu CSV-s."""
+        missing = [c for c in self.columns if c not in df.columns]
+        if not missing or "unique_ID" not in df.columns:
+            return df
+        text = self.fetch(df["unique_ID"].tolist())[missing]
+        text.index = df.index
+        merged = pd.concat([df, text], axis=1)
+        order = [c for c in self.column_order if c in merged.columns]
+        return merged[order + [c for c in merged.columns if c not in order]]
+
+    def frame(self, df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+        """Kogu df koos valitud tekstiveergudega (nt BM25 indeksi ehitamiseks)."""
+        wanted = [c for c in columns if c in self.columns and c not in df.columns]
+        if not wanted or "unique_ID" not in df.columns:
+            return df
+        text = self.fetch(df["unique_ID"].tolist())[wanted]
+        text.index = df.index
+        return pd.concat([df, text], axis=1)
+
+
+def open_catalog(csv_path: str = COURSES_CSV, path: str = CATALOG_FEATHER) -> tuple[pd.DataFrame, LazyText | None]:
+    """
+    (põhiveerud, LazyText) rakendusele ja benchmarkile. Kui Feather-faili pole
+    võimalik kasutada (pyarrow puudub) või unique_ID ei ole unikaalne, tagastab
+    kogu kataloogi ja None.
+    """
+    if ensure_catalog(csv_path, path):
+        pa = _pyarrow()
+        with pa.memory_map(path) as source:
+            names = pa.ipc.open_file(source).schema.names
+        core = [c for c in names if c not in TEXT_COLUMNS]
+        table = pa.feather.read_table(path, columns=core, memory_map=True)
+        if "unique_ID" in core and pa.compute.count_distinct(table.column("unique_ID")).as_py() == table.num_rows:
+            return table.to_pandas(), LazyText(path, names)
+        return load_catalog(csv_path=csv_path, path=path), None
+    return load_catalog(csv_path=csv_path, path=path), None
+
+
+# ---------------------------------------------------------------------------
+# Aruanne: laadimisaeg ja residentne mälu (iga variant eraldi protsessis)
+# ---------------------------------------------------------------------------
+
+_PROBE = """
+import json, time, sys
+import pandas as pd
+from embedding_store import _rss_bytes
+before = _rss_bytes()
+t0 = time.perf_counter()
+variant = sys.argv[1]
+if variant == "csv":
+    df = pd.read_csv(sys.argv[2])
+elif variant == "feather_full":
+    from catalog_store import load_catalog
+    df = load_catalog(csv_path=sys.argv[2], path=sys.argv[3])
+else:
+    from catalog_store import open_catalog
+    df, text = open_catalog(sys.argv[2], sys.argv[3])
+elapsed = time.perf_counter() - t0
+print(json.dumps({"seconds": elapsed, "rss_delta": _rss_bytes() - before,
+                  "frame_bytes": int(df.memory_usage(deep=True).sum()), "columns": len(df.columns)}))
+"""
+
+REPORT_VARIANTS = [
+    ("csv", "CSV (pd.read_csv)"),
+    ("feather_full", "Feather, kõik veerud"),
+    ("feather_core", "Feather, põhiveerud + LazyText"),
+]
+
+
+def report(csv_path: str = COURSES_CSV, path: str = CATALOG_FEATHER, repeats: int = 5) -> dict:
+    build = build_catalog(csv_path, path)
+    print(f"Feather ehitatud: {build['rows']} rida, {build['bytes'] / 1e6:.1f} MB, {build['seconds']:.2f} s\n")
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([here, os.environ.get("PYTHONPATH", "")])}
+    results = {}
+    for variant, _ in REPORT_VARIANTS:
+        runs = []
+        for _ in range(repeats):
+            out = subprocess.run([sys.executable, "-c", _PROBE, variant, csv_path, path],
+                                 capture_output=True, text=True, env=env, check=True)
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        results[variant] = {
+            "seconds": float(np.median([r["seconds"] for r in runs])),
+            "rss_delta_mb": float(np.median([r["rss_delta"] for r in runs])) / 1e6,
+            "frame_mb": runs[0]["frame_bytes"] / 1e6,
+            "columns": runs[0]["columns"],
+        }
+    print(f"{'Variant':<34}{'veerge':>7}{'aeg ms':>9}{'RSS +MB':>9}{'tabel MB':>10}")
+    for variant, label in REPORT_VARIANTS:
+        r = results[variant]
+        print(f"{label:<34}{r['columns']:>7}{r['seconds'] * 1000:>9.1f}{r['rss_delta_mb']:>9.1f}{r['frame_mb']:>10.2f}")
+    print(f"\n(mediaan {repeats} käivitusest; RSS = residentse mälu kasv laadimise ajal)")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kursuste kataloogi Feather-fail")
+    parser.add_argument("--csv", type=str, default=COURSES_CSV)
+    parser.add_argument("--output", type=str, default=CATALOG_FEATHER)
+    parser.add_argument("--report", action="store_true", help="Võrdle CSV ja Feather laadimisaega ning mälu")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.csv, args.output, repeats=args.repeats)
+    else:
+        stats = build_catalog(args.csv, args.output)
+        print(f"✅ {args.output}: {stats['rows']} rida, {stats['columns']} veergu, "
+              f"{stats['bytes'] / 1e6:.1f} MB ({stats['seconds']:.2f} s)")
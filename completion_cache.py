@@ -0,0 +1,110 @@
+"""
+completion_cache.py – Püsiv LLM-i vastuste vahemälu (record / replay / passthrough).
+
+Võti on räsi mudeli nimest ja saadetud sõnumitest. Salvestatakse vastuse tekst,
+tokenite kasutus ning TTFT ja genereerimise aeg, et taasesitatud jooksud
+raporteeriksid realistlikku kulu ja ajastust.
+
+Režiimid:
+    passthrough – vahemälu ei kasutata (vaikimisi)
+    record      – kutsu API-t ja salvesta tulemus; olemasolev kirje taaskasutatakse
+    replay      – ainult salvestatud vastused; puuduva kirje korral CacheMiss
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from llm_client import LLMResult
+from query_cache import CACHE_DIR
+
+COMPLETION_CACHE_DB = os.path.join(CACHE_DIR, "completions.sqlite")
+
+MODE_PASSTHROUGH = "passthrough"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+MODES = (MODE_PASSTHROUGH, MODE_RECORD, MODE_REPLAY)
+
+
+class CacheMiss(Exception):
+    """Replay-režiimis puudub päringu kohta salvestatud vastus."""
+
+
+def request_fingerprint(model: str, messages: list[dict]) -> str:
+    payload = {
+        "model": model,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    def __init__(self, mode: str = MODE_PASSTHROUGH, db_path: str = COMPLETION_CACHE_DB):
+        if mode not in MODES:
+            raise ValueError(f"Tundmatu vahemälu režiim: {mode!r} (lubatud: {', '.join(MODES)})")
+        self.mode = mode
+        self.stats = {"hits": 0, "misses": 0, "stored": 0}
+        self._lock = threading.Lock()
+        self._db = None
+        if mode != MODE_PASSTHROUGH:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                " key TEXT PRIMARY KEY, model TEXT, text TEXT,"
+                " input_tokens INTEGER, output_tokens INTEGER, cost REAL,"
+                " ttft_s REAL, total_s REAL, usage_estimated INTEGER, created_at TEXT)"
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != MODE_PASSTHROUGH
+
+    def get(self, model: str, messages: list[dict]) -> LLMResult | None:
+        """Tagastab salvestatud vastuse või None. Replay-režiimis viskab puudumisel CacheMiss."""
+        if not self.enabled:
+            return None
+        key = request_fingerprint(model, messages)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text, input_tokens, output_tokens, cost, ttft_s, total_s, usage_estimated"
+                " FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            self.stats["hits" if row else "misses"] += 1
+        if row is None:
+            if self.mode == MODE_REPLAY:
+                raise CacheMiss(f"Replay: vastust pole vahemälus (võti {key[:12]}…)")
+            return None
+        return LLMResult(
+            text=row[0],
+            input_tokens=row[1],
+            output_tokens=row[2],
+            cost=row[3],
+            ttft_s=row[4],
+            total_s=row[5],
+            usage_estimated=bool(row[6]),
+            cached=True,
+        )
+
+    def put(self, model: str, messages: list[dict], result: LLMResult):
+        if self.mode != MODE_RECORD:
+            return
+        key = request_fingerprint(model, messages)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, result.text, result.input_tokens, result.output_tokens, result.cost,
+                 result.ttft_s, result.total_s, int(result.usage_estimated),
+                 time.strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            self._db.commit()
+            self.stats["stored"] += 1
+
+    def stats_summary(self) -> dict:
+        with self._lock:
+            return {"mode": self.mode, **self.stats}
@@ -0,0 +1,138 @@
+"""
+context_builder.py – RAG konteksti koostamine LLM-i jaoks tokenieelarve piires.
+
+Varem saadeti kontekstina results_df.to_string(): kõik veerud, fikseeritud
+laiusega täidetud tühikutega. Kompaktne vorming kirjutab iga kursuse kohta
+ainult täidetud väljad kujul "veerg: väärtus". Kui tulemus ületab eelarve,
+lühendatakse pikki tekstivälju prioriteedi järjekorras (kõigepealt õppejõud,
+miinimumnõuded jne, kirjeldus viimasena); kui sellestki ei piisa, jäetakse
+välja madalaima skooriga kursused.
+"""
+
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from llm_client import estimate_tokens
+
+CONTEXT_MODE_COMPACT = "compact"
+CONTEXT_MODE_LEGACY = "legacy"
+CONTEXT_MODES = (CONTEXT_MODE_COMPACT, CONTEXT_MODE_LEGACY)
+
+DEFAULT_CONTEXT_BUDGET = 1500  # tokenit
+
+# Väljade järjekord kontekstis; ülejäänud veerud tulevad nende järel
+FIELD_ORDER = [
+    "unique_ID", "nimi_et", "nimi_en", "eap", "semester", "oppeaste", "keel", "linn",
+    "veebiope", "hindamisviis", "eeldusained", "toimumisajad", "kirjeldus", "opivaljundid",
+    "hindmaismeetod", "miinimumnouded", "oppejoud",
+]
+# Veerud, mida LLM-ile ei saadeta
+EXCLUDED_COLUMNS = {"score", "embedding"}
+
+# Pikkade väljade lühendamise järjekord (esimene lühendatakse esimesena)
+TRUNCATION_ORDER = [
+    "oppejoud", "miinimumnouded", "hindmaismeetod", "toimumisajad",
+    "eeldusained", "opivaljundid", "kirjeldus",
+]
+# Järjest rangemad pikkuspiirangud (tähemärki); 0 = väli jäetakse ära
+TRUNCATION_STEPS = (400, 160, 0)
+
+
+@dataclass
+class ContextResult:
+    text: str
+    tokens: int
+    n_courses: int
+    budget: int | None = None
+    truncated_fields: list[str] = field(default_factory=list)
+    dropped_courses: int = 0
+
+
+def _format_value(value) -> str | None:
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    text = " ".join(str(value).split())
+    return text or None
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0]
+    return cut.rstrip(",.;: ") + " …"
+
+
+def _render(records: list[list[tuple[str, str]]], caps: dict[str, int]) -> str:
+    blocks = []
+    for n, fields in enumerate(records, 1):
+        lines = []
+        for col, value in fields:
+            cap = caps.get(col)
+            if cap == 0:
+                continue
+            if cap is not None:
+                value = _truncate(value, cap)
+            lines.append(f"{col}: {value}")
+        blocks.append(f"[{n}]\n" + "\n".join(lines))
+    return "\n\n".join(blocks)
+
+
+def build_context(results_df: pd.DataFrame, budget: int | None = DEFAULT_CONTEXT_BUDGET) -> ContextResult:
+    """Kompaktne kontekst; budget=None tähendab piiranguta."""
+    columns = [c for c in FIELD_ORDER if c in results_df.columns]
+    columns += [c for c in results_df.columns if c not in columns and c not in EXCLUDED_COLUMNS]
+
+    records = []
+    for row in results_df[columns].itertuples(index=False):
+        fields = []
+        for col, value in zip(columns, row):
+            text = _format_value(value)
+            if text is not None:
+                fields.append((col, text))
+        records.append(fields)
+
+    caps: dict[str, int] = {}
+    truncated: list[str] = []
+    text = _render(records, caps)
+    tokens = estimate_tokens(text)
+
+    if budget is not None:
+        for limit in TRUNCATION_STEPS:
+            for col in TRUNCATION_ORDER:
+                if tokens <= budget:
+                    break
+                if col not in columns:
+                    continue
+                caps[col] = limit
+                if col not in truncated:
+                    truncated.append(col)
+                text = _render(records, caps)
+                tokens = estimate_tokens(text)
+
+    dropped = 0
+    while budget is not None and tokens > budget and len(records) > 1:
+        records.pop()
+        dropped += 1
+        text = _render(records, caps)
+        tokens = estimate_tokens(text)
+
+    return ContextResult(text=text, tokens=tokens, n_courses=len(records), budget=budget,
+                         truncated_fields=truncated, dropped_courses=dropped)
+
+
+def legacy_context(results_df: pd.DataFrame) -> ContextResult:
+    """Endine DataFrame.to_string() kontekst (võrdluseks)."""
+    text = results_df.drop(columns=[c for c in EXCLUDED_COLUMNS if c in results_df.columns]).to_string()
+    return ContextResult(text=text, tokens=estimate_tokens(text), n_courses=len(results_df))
+
+
+def make_context(results_df: pd.DataFrame, mode: str = CONTEXT_MODE_COMPACT,
+                 budget: int | None = DEFAULT_CONTEXT_BUDGET) -> ContextResult:
+    if mode == CONTEXT_MODE_LEGACY:
+        return legacy_context(results_df)
+    if mode == CONTEXT_MODE_COMPACT:
+        return build_context(results_df, budget)
+    raise ValueError(f"Tundmatu konteksti režiim: {mode!r} (lubatud: {', '.join(CONTEXT_MODES)})")
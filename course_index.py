@@ -0,0 +1,302 @@
+"""
+course_index.py – Eelarvutatud mälusisene otsinguindeks kursuste vektoritele.
+
+Indeks ehitatakse üks kord (ois-projekt.py get_models() ja benchmark.py) ning
+hoiab L2-normaliseeritud float32 maatriksit, mille read on joondatud
+kursuste tabeliga. Päring on üks maatriks-vektor korrutis + argpartition;
+filtrid antakse boolean-maskina, mistõttu kataloogi ei kopeerita.
+
+Alternatiivina võib vektorid anda embedding_store.EmbeddingStore'ina
+(float16/int8, mmap, jagatud protsesside vahel): siis skooritakse kvantiseeritud
+vektoritega ja parimad kandidaadid skooritakse float32 vektoritega üle.
+
+Suurte (mitme aasta / ülikooli) kataloogide jaoks saab indeksile lisada
+ligikaudse otsingu (attach_ann, vt ann_index.py); search() liides ei muutu.
+Hoidla korral ehitatakse ANN kvantiseeritud vektoritest ja selle kandidaadid
+skooritakse float32 vektoritega üle nagu täisotsingus.
+
+Mikrobenchmark (vana merge/stack/sort tee vs indeks):
+    python course_index.py                   # data/ failide põhjal
+    python course_index.py --synthetic 5000  # sünteetilised vektorid
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def load_embedding_artifact(npy_path: str, manifest_path: str,
+                            mmap: bool = False) -> tuple[list[str], np.ndarray]:
+    """
+    Laeb build_embeddings.py poolt ehitatud vektorid: (unique_ID-de list, float32 maatriks).
+    mmap=True – maatriks avatakse ainult lugemiseks mmap-ina (ei loeta mällu).
+    """
+    if not (os.path.isfile(npy_path) and os.path.isfile(manifest_path)):
+        raise FileNotFoundError(
+            f"Vektorite artefakti ei leitud ({npy_path}). Ehita see: python build_embeddings.py"
+        )
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    ids = [entry["unique_ID"] for entry in manifest["rows"]]
+    matrix = np.load(npy_path, mmap_mode="r" if mmap else None)
+    if len(ids) != len(matrix):
+        raise ValueError(f"Manifestis on {len(ids)} rida, maatriksis {len(matrix)}.")
+    return ids, matrix
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def top_positions(scores: np.ndarray, k: int,
+                  mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """k suurima skoori positsioonid (kahanevalt) ja skoorid; mask piirab kandidaate."""
+    if mask is not None:
+        candidates = np.flatnonzero(mask)
+        cand_scores = scores[candidates]
+    else:
+        candidates = None
+        cand_scores = scores
+
+    n = len(cand_scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    if k < n:
+        top = np.argpartition(-cand_scores, k - 1)[:k]
+    else:
+        top = np.arange(n)
+    top = top[np.argsort(-cand_scores[top], kind="stable")]
+
+    positions = candidates[top] if candidates is not None else top
+    return positions, cand_scores[top]
+
+
+class CourseIndex:
+    """
+    Kursuste tabel (ilma embedding-veeruta) + normaliseeritud vektorite maatriks.
+    Rida i maatriksis vastab reale i tabelis self.df ja ID-le self.row_ids[i].
+
+    Hoidlaga (from_store) on self.matrix None; rida i vastab hoidla reale
+    self.store_rows[i] ja vektoreid protsessi mällu ei kopeerita.
+
+    attach_text(LazyText) korral pole pikki tekstivälju self.df-is; rows() ja
+    top_k() lisavad need ainult tagastatud ridadele (vt catalog_store.py).
+    """
+
+    def __init__(self, df: pd.DataFrame, matrix: np.ndarray | None = None, store=None,
+                 store_rows: np.ndarray | None = None, rescore_factor: int = 4):
+        n_vectors = len(store_rows if store_rows is not None else store) if store is not None else len(matrix)
+        if len(df) != n_vectors:
+            raise ValueError(f"Tabelis on {len(df)} rida, maatriksis {n_vectors}.")
+        self.df = df.drop(columns=["embedding"], errors="ignore").reset_index(drop=True)
+        self.row_ids = self.df["unique_ID"].to_numpy()
+        self.store = store
+        self.store_rows = store_rows
+        self.rescore_factor = rescore_factor
+        self.matrix = _l2_normalize(matrix) if store is None else None
+        self.ann = None
+        self.text = None
+
+    @classmethod
+    def from_frames(cls, df: pd.DataFrame, embeddings_df: pd.DataFrame) -> "CourseIndex":
+        """Ehitab indeksi kursuste tabelist ja (unique_ID, embedding) tabelist."""
+        merged = pd.merge(df, embeddings_df[["unique_ID", "embedding"]], on="unique_ID")
+        matrix = np.stack(merged["embedding"].values)
+        return cls(merged, matrix)
+
+    @classmethod
+    def from_artifact(cls, df: pd.DataFrame, ids: list[str], matrix: np.ndarray) -> "CourseIndex":
+        """
+        Ehitab indeksi kursuste tabelist ja load_embedding_artifact() väljundist.
+        Nagu pd.merge(..., on='unique_ID'): jäävad alles read, millel on vektor.
+        """
+        positions = pd.Index(ids).get_indexer(df["unique_ID"].astype(str))
+        keep = positions >= 0
+        return cls(df[keep], matrix[positions[keep]])
+
+    @classmethod
+    def from_store(cls, df: pd.DataFrame, ids: list[str], store, rescore_factor: int = 4) -> "CourseIndex":
+        """
+        Nagu from_artifact(), kuid vektorid jäävad EmbeddingStore'i (mmap);
+        joondamiseks hoitakse ainult reanumbreid.
+        """
+        positions = pd.Index(ids).get_indexer(df["unique_ID"].astype(str))
+        keep = positions >= 0
+        rows = positions[keep]
+        if len(rows) == len(store) and np.array_equal(rows, np.arange(len(store))):
+            rows = None
+        return cls(df[keep], store=store, store_rows=rows, rescore_factor=rescore_factor)
+
+    def __len__(self) -> int:
+        return len(self.row_ids)
+
+    @staticmethod
+    def _normalize_query(query_vec: np.ndarray) -> np.ndarray:
+        q = np.asarray(query_vec, dtype=np.float32).ravel()
+        norm = np.linalg.norm(q)
+        return q / norm if norm > 0 else q
+
+    def _store_positions(self, positions: np.ndarray) -> np.ndarray:
+        return self.store_rows[positions] if self.store_rows is not None else positions
+
+    def scores(self, query_vec: np.ndarray) -> np.ndarray:
+        """Kosinussarnasus päringu ja kõigi kursuste vahel (hoidla korral ligikaudne)."""
+        q = self._normalize_query(query_vec)
+        if self.store is None:
+            return self.matrix @ q
+        scores = self.store.scores(q)
+        return scores[self.store_rows] if self.store_rows is not None else scores
+
+    def batch_scores(self, query_vecs: np.ndarray) -> np.ndarray:
+        """(Q x N) skoorid mitme päringu jaoks korraga (ilma üleskoorimiseta)."""
+        Q = np.asarray(query_vecs, dtype=np.float32)
+        Q = Q / np.maximum(np.linalg.norm(Q, axis=1, keepdims=True), 1e-12)
+        if self.store is None:
+            return Q @ self.matrix.T
+        scores = self.store.batch_scores(Q)
+        return scores[:, self.store_rows] if self.store_rows is not None else scores
+
+    def vectors(self):
+        """Normaliseeritud maatriks või hoidla kvantiseeritud vaade (EmbeddingStore.view), ilma koopiata."""
+        return self.matrix if self.store is None else self.store.view(self.store_rows)
+
+    def attach_ann(self, backend: str, **params) -> "CourseIndex":
+        """Lisab ANN indeksi (ann_index.build_ann); edaspidi kasutab search() seda."""
+        from ann_index import build_ann
+
+        self.ann = build_ann(self.vectors(), backend, **params)
+        return self
+
+    def attach_text(self, text) -> "CourseIndex":
+        """Pikad tekstiväljad laisalt (catalog_store.LazyText); None jätab self.df-i nagu on."""
+        self.text = text
+        return self
+
+    def rows(self, positions) -> pd.DataFrame:
+        """Kursuste read positsioonide järgi koos tekstiväljadega."""
+        results = self.df.iloc[positions].copy()
+        return self.text.attach(results) if self.text is not None else results
+
+    def frame(self, text_columns=()) -> pd.DataFrame:
+        """Kogu self.df koos valitud tekstiveergudega (nt BM25 indeksi ehitamiseks)."""
+        return self.text.frame(self.df, list(text_columns)) if self.text is not None else self.df
+
+    @property
+    def rescoring(self) -> bool:
+        return self.store is not None and self.store.can_rescore
+
+    def search(self, query_vec: np.ndarray, k: int = 5,
+               mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Tagastab (reapositsioonid, skoorid) k parima kursuse kohta, kahanevas järjekorras.
+        mask – valikuline boolean-massiiv pikkusega len(self); arvesse võetakse
+        ainult read, kus mask on True.
+        """
+        fetch = k * self.rescore_factor if self.rescoring else k
+        if self.ann is not None:
+            positions, top_scores = self.ann.search(self._normalize_query(query_vec), fetch, mask)
+        else:
+            positions, top_scores = top_positions(self.scores(query_vec), fetch, mask)
+        if not self.rescoring:
+            return positions, top_scores
+
+        # Kvantiseeritud skooridega k * rescore_factor kandidaati, siis täpne float32 järjestus
+        if len(positions) == 0:
+            return positions, np.empty(0, dtype=np.float32)
+        exact = self.store.rescore(self._normalize_query(query_vec), self._store_positions(positions))
+        order = np.argsort(-exact, kind="stable")[:k]
+        return positions[order], exact[order].astype(np.float32)
+
+    def top_k(self, query_vec: np.ndarray, k: int = 5,
+              mask: np.ndarray | None = None) -> pd.DataFrame:
+        """Nagu search(), kuid tagastab kursuste read koos 'score' veeruga."""
+        positions, top_scores = self.search(query_vec, k=k, mask=mask)
+        results = self.rows(positions)
+        results["score"] = top_scores
+        return results
+
+
+# ---------------------------------------------------------------------------
+# Mikrobenchmark
+# ---------------------------------------------------------------------------
+
+def _legacy_top_k(df, embeddings_df, query_vec, k):
+    """Endine päringupõhine tee: merge + np.stack + cosine_similarity + sort."""
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    merged_df = pd.merge(df, embeddings_df, on="unique_ID")
+    filtered_df = merged_df[pd.Series(True, index=merged_df.index)].copy()
+    filtered_df["score"] = cosine_similarity([query_vec], np.stack(filtered_df["embedding"]))[0]
+    return filtered_df.sort_values("score", ascending=False).head(k)
+
+
+def _time_per_query(fn, queries, repeat):
+    fn(queries[0])  # soojendus
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(q)
+    return (time.perf_counter() - t0) / (repeat * len(queries))
+
+
+def _load_benchmark_data(synthetic: int | None, dim: int, seed: int = 0):
+    if synthetic:
+        rng = np.random.default_rng(seed)
+        ids = [f"SYN.{i:06d}" for i in range(synthetic)]
+        df = pd.DataFrame({"unique_ID": ids, "nimi_et": ids, "eap": 6.0})
+        vectors = rng.standard_normal((synthetic, dim)).astype(np.float32)
+        embeddings_df = pd.DataFrame({"unique_ID": ids, "embedding": list(vectors)})
+        return df, embeddings_df
+
+    from benchmark import COURSES_CSV, EMBEDDINGS_NPY, EMBEDDINGS_MANIFEST
+    ids, matrix = load_embedding_artifact(EMBEDDINGS_NPY, EMBEDDINGS_MANIFEST)
+    return pd.read_csv(COURSES_CSV), pd.DataFrame({"unique_ID": ids, "embedding": list(matrix)})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CourseIndex otsingu mikrobenchmark")
+    parser.add_argument("--synthetic", type=int, default=None,
+                        help="Kasuta N sünteetilist vektorit päris andmete asemel")
+    parser.add_argument("--dim", type=int, default=1024, help="Sünteetiliste vektorite mõõde")
+    parser.add_argument("--queries", type=int, default=20, help="Päringute arv")
+    parser.add_argument("--repeat", type=int, default=3, help="Korduste arv")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    df, embeddings_df = _load_benchmark_data(args.synthetic, args.dim)
+    rng = np.random.default_rng(1)
+    # Päringud = kataloogi vektorid + väike müra
+    base = np.stack(embeddings_df["embedding"].values[: args.queries]).astype(np.float32)
+    queries = list(base + 0.1 * rng.standard_normal(base.shape).astype(np.float32))
+
+    t0 = time.perf_counter()
+    index = CourseIndex.from_frames(df, embeddings_df)
+    build_s = time.perf_counter() - t0
+
+    legacy_s = _time_per_query(lambda q: _legacy_top_k(df, embeddings_df, q, args.top_k), queries, args.repeat)
+    index_s = _time_per_query(lambda q: index.top_k(q, args.top_k), queries, args.repeat)
+    half_mask = np.zeros(len(index), dtype=bool)
+    half_mask[::2] = True
+    masked_s = _time_per_query(lambda q: index.top_k(q, args.top_k, mask=half_mask), queries, args.repeat)
+
+    # Kontroll: mõlemad teed annavad samad ID-d
+    mismatches = sum(
+        _legacy_top_k(df, embeddings_df, q, args.top_k)["unique_ID"].tolist() != index.top_k(q, args.top_k)["unique_ID"].tolist()
+        for q in queries
+    )
+
+    print(f"Kursusi indeksis:              {len(index)}")
+    print(f"Indeksi ehitamine:             {build_s * 1000:.1f} ms (üks kord)")
+    print(f"Vana tee (merge/stack/sort):   {legacy_s * 1000:.2f} ms/päring")
+    print(f"CourseIndex.top_k:             {index_s * 1000:.2f} ms/päring")
+    print(f"CourseIndex.top_k (50% mask):  {masked_s * 1000:.2f} ms/päring")
+    print(f"Kiirendus:                     {legacy_s / index_s:.1f}x")
+    print(f"Erinevad top-{args.top_k} tulemused:     {mismatches}/{len(queries)}")
@@ -0,0 +1,342 @@
+"""
+embedding_store.py – Kvantiseeritud vektorite hoidla, jagatud protsesside vahel mmap-i kaudu.
+
+Vektorid L2-normaliseeritakse ja kirjutatakse eraldi .npy failidesse:
+    data/puhtad_andmed_embeddings.float32.npy
+    data/puhtad_andmed_embeddings.float16.npy
+    data/puhtad_andmed_embeddings.int8.npy  (+ .int8.scales.npy, skaala iga vektori kohta)
+
+Failid avatakse ainult lugemiseks (np.load(mmap_mode="r")), nii et mitu
+Streamliti protsessi jagavad operatsioonisüsteemi lehevahemälus sama koopiat
+ega hoia igaüks oma maatriksit. Kvantiseeritud skooride järel saab parimad
+kandidaadid üle skoorida täpsete float32 vektoritega algsest artefaktist
+(mmap-ist loetakse ainult kandidaatide read).
+
+Käivitamine:
+    python embedding_store.py --build              # ehita kõik täpsused
+    python embedding_store.py --report --limit 50  # mälu ja recall@5 iga täpsuse kohta
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmark import EMBEDDINGS_NPY, EMBEDDINGS_MANIFEST
+from course_index import CourseIndex, load_embedding_artifact
+
+PRECISIONS = ("float32", "float16", "int8")
+DEFAULT_PRECISION = "float32"
+# Mitu korda rohkem kandidaate võetakse float32 üleskoorimiseks (k * factor)
+DEFAULT_RESCORE_FACTOR = 4
+# Ridu korraga skoorimisel (piirab ajutise float32 puhvri suurust; 512 x 1024 -> 2 MB)
+SCORE_CHUNK_ROWS = 512
+
+
+def store_paths(precision: str, npy_path: str = EMBEDDINGS_NPY) -> tuple[str, str | None]:
+    """(koodide fail, skaalade fail või None)."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Tundmatu täpsus: {precision!r} (lubatud: {', '.join(PRECISIONS)})")
+    base = npy_path[:-4] if npy_path.endswith(".npy") else npy_path
+    codes = f"{base}.{precision}.npy"
+    scales = f"{base}.{precision}.scales.npy" if precision == "int8" else None
+    return codes, scales
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def quantize(matrix: np.ndarray, precision: str) -> tuple[np.ndarray, np.ndarray | None]:
+    """Normaliseerib read ja tagastab (koodid, skaalad); skaalad ainult int8 korral."""
+    unit = normalize_rows(matrix)
+    if precision == "float32":
+        return np.ascontiguousarray(unit), None
+    if precision == "float16":
+        return np.ascontiguousarray(unit.astype(np.float16)), None
+    if precision == "int8":
+        scales = np.abs(unit).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(unit / scales[:, None]), -127, 127).astype(np.int8)
+        return np.ascontiguousarray(codes), scales.astype(np.float32)
+    raise ValueError(f"Tundmatu täpsus: {precision!r}")
+
+
+def _save_atomic(path: str, array: np.ndarray, mode_from: str):
+    """
+    Kirjutab unikaalsesse ajutisse faili samas kaustas ja asendab sihtfaili
+    (samaaegsed ehitajad ei kirjuta üksteise ajutist faili üle). Õigused
+    võetakse failist mode_from (NamedTemporaryFile loob faili õigustega 0600).
+    """
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as tmp:
+        tmp_path = tmp.name
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        shutil.copymode(mode_from, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_store(precision: str, npy_path: str = EMBEDDINGS_NPY) -> str:
+    """
+    Kirjutab antud täpsusega hoidla float32 artefakti põhjal; tagastab koodide
+    faili tee. int8 skaalad kirjutatakse viimasena: kuni need on artefaktist
+    vanemad, peab store_is_stale hoidlat aegunuks ja uusi koode vanade
+    skaaladega ei kasutata.
+    """
+    codes_path, scales_path = store_paths(precision, npy_path)
+    codes, scales = quantize(np.load(npy_path, mmap_mode="r"), precision)
+    _save_atomic(codes_path, codes, mode_from=npy_path)
+    if scales_path:
+        _save_atomic(scales_path, scales, mode_from=npy_path)
+    return codes_path
+
+
+def store_is_stale(precision: str, npy_path: str = EMBEDDINGS_NPY) -> bool:
+    codes_path, scales_path = store_paths(precision, npy_path)
+    source_mtime = os.path.getmtime(npy_path)
+    for path in (codes_path, scales_path):
+        if path and (not os.path.isfile(path) or os.path.getmtime(path) < source_mtime):
+            return True
+    return False
+
+
+class StoreView:
+    """
+    Hoidla read float32-na (int8 korral skaalaga korrutatud), loetakse mmap-ist
+    alles indekseerimisel. Massiivilaadne (len, shape, [read]) ANN indeksi jaoks.
+    rows – valikuline vaate positsioon -> hoidla rida (CourseIndex.store_rows).
+    """
+
+    def __init__(self, store: "EmbeddingStore", rows: np.ndarray | None = None):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self) -> int:
+        return len(self.rows) if self.rows is not None else len(self.store)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self), self.store.dim
+
+    def __getitem__(self, idx) -> np.ndarray:
+        rows = self.rows[idx] if self.rows is not None else idx
+        out = np.asarray(self.store.codes[rows], dtype=np.float32)
+        if self.store.scales is not None:
+            out *= np.asarray(self.store.scales[rows], dtype=np.float32)[:, None]
+        return out
+
+
+class EmbeddingStore:
+    """
+    Ainult lugemiseks avatud (mmap) vektorite hoidla. scores(q) annab ligikaudse
+    kosinussarnasuse kõigi ridadega; rescore(q, read) täpse float32 skoori.
+    """
+
+    def __init__(self, codes: np.ndarray, precision: str, scales: np.ndarray | None = None,
+                 exact: np.ndarray | None = None):
+        self.codes = codes
+        self.precision = precision
+        self.scales = scales
+        self.exact = exact
+
+    @classmethod
+    def open(cls, precision: str = DEFAULT_PRECISION, npy_path: str = EMBEDDINGS_NPY,
+             rescore: bool = True, build_missing: bool = True) -> "EmbeddingStore":
+        """
+        Avab hoidla mmap-ina. build_missing – ehita fail, kui see puudub või on
+        artefaktist vanem. rescore – ava ka float32 artefakt üleskoorimiseks.
+        """
+        if build_missing and store_is_stale(precision, npy_path):
+            build_store(precision, npy_path)
+        codes_path, scales_path = store_paths(precision, npy_path)
+        # Skaalad enne koode: build_store kirjutab need viimasena, seega uute
+        # skaaladega koos loetakse alati ka uued koodid
+        scales = np.load(scales_path, mmap_mode="r") if scales_path else None
+        codes = np.load(codes_path, mmap_mode="r")
+        exact = np.load(npy_path, mmap_mode="r") if rescore and precision != "float32" else None
+        return cls(codes, precision, scales=scales, exact=exact)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def dim(self) -> int:
+        return self.codes.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        """Hoidla suurus baitides (jagatud mmap, mitte protsessi privaatne mälu)."""
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def can_rescore(self) -> bool:
+        return self.exact is not None
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Ligikaudne kosinussarnasus; query peab olema normaliseeritud float32 vektor."""
+        q = np.asarray(query, dtype=np.float32).ravel()
+        if self.precision == "float32":
+            return np.asarray(self.codes @ q, dtype=np.float32)
+        out = np.empty(len(self.codes), dtype=np.float32)
+        for start in range(0, len(self.codes), SCORE_CHUNK_ROWS):
+            stop = start + SCORE_CHUNK_ROWS
+            out[start:stop] = self.codes[start:stop].astype(np.float32) @ q
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def batch_scores(self, queries: np.ndarray) -> np.ndarray:
+        """(Q x N) skoorid normaliseeritud päringute maatriksi jaoks."""
+        Q = np.asarray(queries, dtype=np.float32)
+        if self.precision == "float32":
+            return np.asarray(Q @ self.codes.T, dtype=np.float32)
+        out = np.empty((len(Q), len(self.codes)), dtype=np.float32)
+        for start in range(0, len(self.codes), SCORE_CHUNK_ROWS):
+            stop = start + SCORE_CHUNK_ROWS
+            out[:, start:stop] = Q @ self.codes[start:stop].astype(np.float32).T
+        if self.scales is not None:
+            out *= self.scales[None, :]
+        return out
+
+    def view(self, rows: np.ndarray | None = None) -> StoreView:
+        """Kvantiseeritud vektorid ANN indeksi ehitamiseks ja skoorimiseks (ilma koopiata)."""
+        return StoreView(self, rows)
+
+    def rescore(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Täpne float32 kosinussarnasus antud ridadele (loeb mmap-ist ainult need read)."""
+        q = np.asarray(query, dtype=np.float32).ravel()
+        source = self.exact if self.exact is not None else self.codes
+        vectors = normalize_rows(np.asarray(source[np.sort(rows)], dtype=np.float32))
+        order = np.argsort(np.argsort(rows))
+        return (vectors @ q)[order]
+
+
+def load_course_index(df: pd.DataFrame, precision: str | None = None,
+                      npy_path: str = EMBEDDINGS_NPY, manifest_path: str = EMBEDDINGS_MANIFEST,
+                      rescore_factor: int = DEFAULT_RESCORE_FACTOR,
+                      ann_backend: str | None = None) -> CourseIndex:
+    """
+    CourseIndex rakendusele ja benchmarkile. precision (või keskkonnamuutuja
+    EMBEDDING_PRECISION) float32/float16/int8 -> mmap-hoidla; määramata -> senine
+    mälusisene float32 maatriks. ann_backend (või ANN_BACKEND) ivf/hnsw lisab
+    indeksile ligikaudse otsingu (ann_index.py).
+    """
+    precision = precision or os.getenv("EMBEDDING_PRECISION") or None
+    ann_backend = ann_backend or os.getenv("ANN_BACKEND") or None
+    ids, matrix = load_embedding_artifact(npy_path, manifest_path, mmap=precision is not None)
+    if precision is None:
+        index = CourseIndex.from_artifact(df, ids, matrix)
+    else:
+        store = EmbeddingStore.open(precision, npy_path=npy_path)
+        index = CourseIndex.from_store(df, ids, store, rescore_factor=rescore_factor)
+    if ann_backend:
+        index.attach_ann(ann_backend)
+    return index
+
+
+# ---------------------------------------------------------------------------
+# Aruanne: mälu protsessi kohta ja recall@5 iga täpsuse kohta
+# ---------------------------------------------------------------------------
+
+def _rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def report(limit: int | None = None, k: int = 5, rescore_factor: int = DEFAULT_RESCORE_FACTOR):
+    from benchmark import COURSES_CSV, load_resources, load_test_cases, retrieval_metrics
+
+    embedder, _ = load_resources()
+    queries, expected = load_test_cases(limit)
+    query_vecs = normalize_rows(np.asarray(embedder.encode(queries), dtype=np.float32))
+    df = pd.read_csv(COURSES_CSV)
+    ids, _ = load_embedding_artifact(EMBEDDINGS_NPY, EMBEDDINGS_MANIFEST, mmap=True)
+
+    def evaluate(index: CourseIndex) -> tuple[float, float, list]:
+        t0 = time.perf_counter()
+        ranked = [index.search(v, k=k)[0] for v in query_vecs]
+        ms = (time.perf_counter() - t0) / max(1, len(queries)) * 1000
+        recalls = [
+            retrieval_metrics([str(index.row_ids[p]) for p in pos], exp, ks=(k,))[f"recall@{k}"]
+            for pos, exp in zip(ranked, expected) if exp
+        ]
+        return (float(np.mean(recalls)) if recalls else 0.0), ms, ranked
+
+    def measure(load):
+        """(indeks, püsiv privaatne mälu, tipp) laadimise ja ühe päringu ajal."""
+        tracemalloc.start()
+        index = load()
+        index.search(query_vecs[0], k=k)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return index, retained, peak
+
+    # Võrdlusalus: senine mälusisene float32 maatriks
+    baseline, retained, peak = measure(lambda: CourseIndex.from_artifact(df, ids, np.load(EMBEDDINGS_NPY)))
+    base_recall, base_ms, base_ranked = evaluate(baseline)
+    rows = [("mälus float32", baseline.matrix.nbytes, retained, peak, base_recall, 1.0, base_ms)]
+
+    for precision in PRECISIONS:
+        for rescore in ((False, True) if precision != "float32" else (False,)):
+            index, retained, peak = measure(lambda: CourseIndex.from_store(
+                df, ids, EmbeddingStore.open(precision, rescore=rescore), rescore_factor=rescore_factor))
+            recall, ms, ranked = evaluate(index)
+            overlap = np.mean([len(set(a) & set(b)) / max(1, len(a)) for a, b in zip(ranked, base_ranked)])
+            label = f"mmap {precision}" + (" + float32 üleskoor." if rescore else "")
+            rows.append((label, index.store.nbytes, retained, peak, recall, overlap, ms))
+
+    lines = [
+        f"Kursusi: {len(baseline)}, mõõde: {baseline.matrix.shape[1]}, päringuid: {len(queries)}, k={k}",
+        f"{'Variant':<34}{'Hoidla':>10}{'Püsiv':>10}{'Tipp':>10}{f'recall@{k}':>11}{'kattuvus':>10}{'ms/päring':>11}",
+    ]
+    for label, size, retained, peak, recall, overlap, ms in rows:
+        lines.append(f"{label:<34}{size / 2**20:>8.2f}MB{retained / 2**20:>8.2f}MB{peak / 2**20:>8.2f}MB"
+                     f"{recall:>11.1%}{overlap:>10.1%}{ms:>11.3f}")
+    lines += [
+        "",
+        "Hoidla – vektorite maht; mmap korral jagatud kõigi protsesside vahel (lehevahemälu).",
+        "Püsiv / Tipp – protsessi enda eraldatud mälu pärast laadimist ja esimese päringu ajal (tracemalloc).",
+        f"Kattuvus – top-{k} ühisosa mälusisese float32 tulemusega.",
+    ]
+    rss = _rss_bytes()
+    if rss:
+        lines.append(f"Protsessi RSS aruande lõpus: {rss / 2**20:.0f} MB")
+    print("\n".join(lines))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kvantiseeritud vektorite hoidla")
+    parser.add_argument("--build", action="store_true", help="Ehita kõigi täpsustega hoidlad")
+    parser.add_argument("--report", action="store_true", help="Mälu ja recall@5 iga täpsuse kohta")
+    parser.add_argument("--limit", type=int, default=None, help="Piira testjuhtumite arvu")
+    parser.add_argument("--rescore-factor", type=int, default=DEFAULT_RESCORE_FACTOR,
+                        help=f"Üleskooritavate kandidaatide kordaja (vaikimisi {DEFAULT_RESCORE_FACTOR})")
+    args = parser.parse_args()
+
+    if args.build:
+        for p in PRECISIONS:
+            path = build_store(p)
+            print(f"{p:<8} -> {path}")
+    if args.report:
+        report(limit=args.limit, rescore_factor=args.rescore_factor)
@@ -0,0 +1,258 @@
+"""
+encode_scheduler.py – Samaaegsete manustamispäringute mikropartiid.
+
+Mitu vestlusseanssi (või otsinguserveri lõime) kutsub jagatud mudelit
+encode([päring]) ühekaupa. EncodeScheduler kogub päringuid kuni max_wait_ms
+(alates esimesest ootavast päringust) või kuni max_batch tekstini, teeb ühe
+partii encode() kutse ja annab igale kutsujale tema vektorid tagasi. Mudelit
+kutsub ainult üks töölõim, seega on kutsed ka järjestatud.
+
+    model = EncodeScheduler(SentenceTransformer(...), max_wait_ms=5, max_batch=32)
+    embedder = CachedEmbedder(model, model_name)     # vahemälu tabamused ei oota partiid
+    model.stats()                                    # partiide suuruse ja järjekorra histogrammid
+
+Rakenduses ja otsinguserveris (startup.Warmup) seadistatakse keskkonnamuutujatega
+ENCODE_MAX_WAIT_MS (vaikimisi 5, 0 = välja lülitatud) ja ENCODE_MAX_BATCH (vaikimisi 32).
+
+Samaaegsuse test (partii-ühekaupa vs mikropartiid):
+    python encode_scheduler.py --clients 16 --requests 400
+    python encode_scheduler.py --synthetic --clients 16   # ilma mudelita, NumPy kihtidega
+"""
+
+import argparse
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_MAX_WAIT_MS = 5.0
+DEFAULT_MAX_BATCH = 32
+# Histogrammi vahemikud (ülempiirid); viimane koondab kõik suuremad
+HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+BUCKET_LABELS = tuple(f"≤{b}" for b in HISTOGRAM_BUCKETS) + (f">{HISTOGRAM_BUCKETS[-1]}",)
+
+
+def _bucket(value: int) -> str:
+    for upper in HISTOGRAM_BUCKETS:
+        if value <= upper:
+            return f"≤{upper}"
+    return f">{HISTOGRAM_BUCKETS[-1]}"
+
+
+class EncodeScheduler:
+    """Mudeli ümbris: encode() nagu SentenceTransformer'il, kuid päringud liidetakse partiideks."""
+
+    def __init__(self, model, max_wait_ms: float = DEFAULT_MAX_WAIT_MS, max_batch: int = DEFAULT_MAX_BATCH):
+        self.model = model
+        self.max_wait_s = max_wait_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue: queue.Queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._queue_depths: Counter = Counter()
+        self._totals = {"requests": 0, "texts": 0, "batches": 0, "encode_s": 0.0}
+        self._worker = threading.Thread(target=self._run, name="encode-scheduler", daemon=True)
+        self._worker.start()
+
+    # --- avalik liides ---
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        """Blokeerib, kuni selle kutse tekstid on partiis manustatud."""
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        future: Future = Future()
+        self._queue.put((texts, kwargs, future))
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            totals = dict(self._totals)
+            batch_sizes = dict(self._batch_sizes)
+            queue_depths = dict(self._queue_depths)
+        batches = totals["batches"]
+        return {
+            **totals,
+            "avg_batch": totals["texts"] / batches if batches else 0.0,
+            "batch_size_hist": {b: batch_sizes.get(b, 0) for b in BUCKET_LABELS},
+            "queue_depth_hist": {b: queue_depths.get(b, 0) for b in BUCKET_LABELS},
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def histogram_lines(self) -> list[str]:
+        s = self.stats()
+        lines = [f"Partiisid: {s['batches']}, tekste: {s['texts']}, keskmine partii: {s['avg_batch']:.1f}",
+                 f"{'vahemik':>8} {'partii suurus':>14} {'järjekord':>10}"]
+        for bucket in s["batch_size_hist"]:
+            lines.append(f"{bucket:>8} {s['batch_size_hist'][bucket]:>14} {s['queue_depth_hist'][bucket]:>10}")
+        return lines
+
+    def __getattr__(self, name):
+        # Muud atribuudid (nt get_sentence_embedding_dimension) tulevad mudelilt
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+    # --- töölõim ---
+
+    def _collect(self, first) -> tuple[list, list]:
+        """Kogub first-iga samade kwargs'idega päringud partiiks; teised jäävad järgmisse."""
+        batch, deferred = [first], []
+        n_texts = len(first[0])
+        deadline = time.monotonic() + self.max_wait_s
+        while n_texts < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item[1] == first[1] and n_texts + len(item[0]) <= self.max_batch:
+                batch.append(item)
+                n_texts += len(item[0])
+            else:
+                deferred.append(item)
+                break
+        return batch, deferred
+
+    def _run(self):
+        pending: list = []
+        while True:
+            first = pending.pop(0) if pending else self._queue.get()
+            depth = self._queue.qsize() + len(pending) + 1
+            batch, deferred = self._collect(first)
+            pending.extend(deferred)
+
+            texts = [t for item in batch for t in item[0]]
+            t0 = time.perf_counter()
+            try:
+                vectors = np.asarray(self.model.encode(texts, **first[1]), dtype=np.float32)
+            except Exception as e:
+                for item in batch:
+                    item[2].set_exception(e)
+                continue
+            elapsed = time.perf_counter() - t0
+
+            start = 0
+            for item_texts, _, future in batch:
+                future.set_result(vectors[start:start + len(item_texts)])
+                start += len(item_texts)
+
+            with self._stats_lock:
+                self._batch_sizes[_bucket(len(texts))] += 1
+                self._queue_depths[_bucket(depth)] += 1
+                self._totals["requests"] += len(batch)
+                self._totals["texts"] += len(texts)
+                self._totals["batches"] += 1
+                self._totals["encode_s"] += elapsed
+
+
+def scheduler_from_env(model):
+    """
+    Rakenduse ja otsinguserveri vaikimisi ümbris: ENCODE_MAX_WAIT_MS ja
+    ENCODE_MAX_BATCH; ENCODE_MAX_WAIT_MS=0 lülitab mikropartiid välja.
+    """
+    max_wait_ms = float(os.getenv("ENCODE_MAX_WAIT_MS", DEFAULT_MAX_WAIT_MS))
+    if max_wait_ms <= 0:
+        return model
+    return EncodeScheduler(model, max_wait_ms=max_wait_ms,
+                           max_batch=int(os.getenv("ENCODE_MAX_BATCH", DEFAULT_MAX_BATCH)))
+
+
+# ---------------------------------------------------------------------------
+# Samaaegsuse test
+# ---------------------------------------------------------------------------
+
+class _SyntheticModel:
+    """Mudelita testimiseks: räsitud sõnakott + kaks tihedat kihti (NumPy), nagu väike kodeerija."""
+
+    def __init__(self, dim: int = 1024, hidden: int = 2048, vocab: int = 8192, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.vocab = vocab
+        self.w1 = rng.standard_normal((vocab, hidden)).astype(np.float32) / np.sqrt(vocab)
+        self.w2 = rng.standard_normal((hidden, dim)).astype(np.float32) / np.sqrt(hidden)
+        self._lock = threading.Lock()
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        x = np.zeros((len(texts), self.vocab), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                x[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.vocab] += 1.0
+        with self._lock:  # nagu üks jagatud mudel: forward'id järjestikku
+            return np.tanh(x @ self.w1) @ self.w2
+
+
+class _SerialModel:
+    """Võrdlus: iga kutse eraldi (partii suurusega 1), jagatud mudel lukuga."""
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.Lock()
+
+    def encode(self, texts, **kwargs):
+        with self._lock:
+            return self.model.encode(texts, **kwargs)
+
+
+def _drive(model, queries: list[str], clients: int, n_requests: int) -> dict:
+    def one(i: int) -> float:
+        t = time.perf_counter()
+        model.encode([f"{queries[i % len(queries)]} {i}"])
+        return time.perf_counter() - t
+
+    one(0)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = np.array(list(pool.map(one, range(n_requests)))) * 1000
+    wall_s = time.perf_counter() - t0
+    return {"throughput": n_requests / wall_s, "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95))}
+
+
+def concurrency_test(clients: int = 16, n_requests: int = 400, max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                     max_batch: int = DEFAULT_MAX_BATCH, synthetic: bool = False) -> dict:
+    from benchmark import EMBEDDING_MODEL, load_test_cases
+
+    queries, _ = load_test_cases()
+    if synthetic:
+        model = _SyntheticModel()
+    else:
+        from sentence_transformers import SentenceTransformer
+
+        print(f"Laen mudelit {EMBEDDING_MODEL} ...", flush=True)
+        model = SentenceTransformer(EMBEDDING_MODEL)
+
+    serial = _drive(_SerialModel(model), queries, clients, n_requests)
+    scheduler = EncodeScheduler(model, max_wait_ms=max_wait_ms, max_batch=max_batch)
+    batched = _drive(scheduler, queries, clients, n_requests)
+
+    print("=" * 60)
+    print(f"MANUSTAMISE SAMAAEGSUSE TEST ({clients} klienti, {n_requests} päringut)")
+    print("=" * 60)
+    print(f"{'':<22}{'päringut/s':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for label, r in (("partii suurusega 1", serial), (f"mikropartiid ({max_wait_ms:g} ms)", batched)):
+        print(f"{label:<22}{r['throughput']:>12.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}")
+    print(f"Kiirendus: {batched['throughput'] / serial['throughput']:.1f}x")
+    print()
+    for line in scheduler.histogram_lines():
+        print(line)
+    print("=" * 60)
+    return {"serial": serial, "batched": batched, "scheduler": scheduler.stats()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mikropartiide samaaegsuse test")
+    parser.add_argument("--clients", type=int, default=16, help="Samaaegsete kutsujate arv")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS)
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--synthetic", action="store_true", help="NumPy mudel bge-m3 asemel")
+    args = parser.parse_args()
+
+    concurrency_test(clients=args.clients, n_requests=args.requests, max_wait_ms=args.max_wait_ms,
+                     max_batch=args.max_batch, synthetic=args.synthetic)
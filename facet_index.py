@@ -0,0 +1,302 @@
+"""
+facet_index.py – Külgriba filtrite eelarvutatud bitmap-indeks.
+
+Andmete laadimisel salvestatakse iga filtrivõimaluse (semester, hindamisviis,
+normaliseeritud linn, õppeaste, õppevorm, eeldusainete puudumine) jaoks üks
+pakitud bitmap (np.packbits) ning EAP väärtused sorteeritud massiivina
+vahemikupäringute jaoks. Filtrite kombineerimine on seejärel ainult bitikaupa
+AND/OR eelarvutatud massiividel.
+
+Filtrid antakse samas kujus sõnastikuna, nagu need seansifaili salvestatakse:
+    {"eap_range": (lo, hi), "semester_opts": [...], "hindamis_opts": [...],
+     "linn_opts": [...], "aste_opts": [...], "veeb_opts": [...], "no_prereqs": bool}
+
+Kontroll, et tulemused ühtivad endiste pandas-maskidega:
+    python facet_index.py --verify
+    python facet_index.py --verify --csv muu_kataloog.csv
+"""
+
+import argparse
+import itertools
+import random
+
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------------------------
+# Külgriba valikud ja nende vastavus andmestiku väärtustele
+# ---------------------------------------------------------------------------
+SEMESTER_OPTIONS = ["kevad", "sügis"]
+HINDAMIS_OPTIONS = ["Eristav", "Eristamata"]
+LINN_OPTIONS = ["Tartu", "Tallinn", "Narva", "Pärnu", "Viljandi", "Tõravere"]
+ASTE_OPTIONS = ["bakalaureuse", "magistri", "doktori"]
+VEEB_OPTIONS = ["põimõpe", "lähiõpe", "veebiõpe"]
+
+HIND_MAP = {"Eristav": "Eristav (A, B, C, D, E, F, mi)", "Eristamata": "Eristamata (arv, m.arv, mi)"}
+
+# Linn -> (andmestiku väärtused, kas puuduv väärtus loetakse selleks linnaks)
+CITY_MAP = {
+    "Tartu": (["Tartu linn", "Tartu"], True),
+    "Narva": (["Narva linn"], False),
+    "Viljandi": (["Viljandi linn"], False),
+    "Pärnu": (["Pärnu linn"], False),
+    "Tõravere": (["Tõravere alevik"], False),
+    "Tallinn": (["Tallinn"], False),
+}
+
+# Bitide arv iga baidi väärtuse kohta (popcount)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint32)
+
+
+def default_filters(max_eap: float) -> dict:
+    return {
+        "eap_range": (0.0, max_eap),
+        "semester_opts": [],
+        "hindamis_opts": [],
+        "linn_opts": [],
+        "aste_opts": [],
+        "veeb_opts": [],
+        "no_prereqs": False,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Viitelahendus: endised pandas-maskid
+# ---------------------------------------------------------------------------
+
+def pandas_filter_mask(df: pd.DataFrame, filters: dict) -> pd.Series:
+    """Endine päringupõhine pandas-mask; kasutusel FacetIndex-i kontrollimiseks."""
+    eap_range = filters.get("eap_range")
+    semester_opts = filters.get("semester_opts") or []
+    hindamis_opts = filters.get("hindamis_opts") or []
+    linn_opts = filters.get("linn_opts") or []
+    aste_opts = filters.get("aste_opts") or []
+    veeb_opts = filters.get("veeb_opts") or []
+
+    mask = pd.Series(True, index=df.index)
+    if eap_range is not None:
+        mask &= (df['eap'] >= eap_range[0]) & (df['eap'] <= eap_range[1])
+    if semester_opts:
+        mask &= df['semester'].isin(semester_opts)
+    if hindamis_opts:
+        mask &= df['hindamisviis'].isin([HIND_MAP[h] for h in hindamis_opts])
+    if linn_opts:
+        linn_mask = pd.Series(False, index=df.index)
+        if "Tartu" in linn_opts:
+            linn_mask |= df['linn'].isin(["Tartu linn", "Tartu"]) | df['linn'].isna()
+        if "Narva" in linn_opts:
+            linn_mask |= (df['linn'] == "Narva linn")
+        if "Viljandi" in linn_opts:
+            linn_mask |= (df['linn'] == "Viljandi linn")
+        if "Pärnu" in linn_opts:
+            linn_mask |= (df['linn'] == "Pärnu linn")
+        if "Tõravere" in linn_opts:
+            linn_mask |= (df['linn'] == "Tõravere alevik")
+        if "Tallinn" in linn_opts:
+            linn_mask |= (df['linn'] == "Tallinn")
+        mask &= linn_mask
+    if aste_opts:
+        pattern = '|'.join(aste_opts)
+        mask &= df['oppeaste'].str.contains(pattern, case=False, na=False)
+    if veeb_opts:
+        mask &= df['veebiope'].isin(veeb_opts)
+    if filters.get("no_prereqs"):
+        mask &= df['eeldusained'].isna()
+    return mask
+
+
+# ---------------------------------------------------------------------------
+# Bitmap-indeks
+# ---------------------------------------------------------------------------
+
+class FacetIndex:
+    """
+    Eelarvutatud pakitud bitmapid iga filtrivõimaluse kohta. Read on joondatud
+    sama DataFrame'iga, millest indeks ehitati (nt CourseIndex.df).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.n_rows = len(df)
+        self._all = self._pack(np.ones(self.n_rows, dtype=bool))
+        self._empty = self._pack(np.zeros(self.n_rows, dtype=bool))
+
+        self.semester = self._value_bitmaps(df.get("semester"))
+        self.hindamisviis = self._value_bitmaps(df.get("hindamisviis"))
+        self.veebiope = self._value_bitmaps(df.get("veebiope"))
+
+        linn = df.get("linn")
+        self.linn = {}
+        for city, (values, include_na) in CITY_MAP.items():
+            if linn is None:
+                self.linn[city] = self._empty
+                continue
+            city_mask = linn.isin(values).to_numpy()
+            if include_na:
+                city_mask = city_mask | linn.isna().to_numpy()
+            self.linn[city] = self._pack(city_mask)
+
+        oppeaste = df.get("oppeaste")
+        self.oppeaste = {}
+        for aste in ASTE_OPTIONS:
+            if oppeaste is None:
+                self.oppeaste[aste] = self._empty
+            else:
+                lowered = oppeaste.str.lower()
+                self.oppeaste[aste] = self._pack(lowered.str.contains(aste.lower(), regex=False, na=False).to_numpy())
+
+        eeldusained = df.get("eeldusained")
+        self.no_prereqs = self._pack(eeldusained.isna().to_numpy()) if eeldusained is not None else self._all
+
+        # EAP: sorteeritud väärtused + vastavad reapositsioonid (NaN jäetakse välja)
+        eap = pd.to_numeric(df["eap"], errors="coerce").to_numpy(dtype=np.float64) if "eap" in df.columns \
+            else np.full(self.n_rows, np.nan)
+        valid = np.flatnonzero(~np.isnan(eap))
+        order = valid[np.argsort(eap[valid], kind="stable")]
+        self.eap_sorted = eap[order]
+        self.eap_order = order
+
+    # --- abimeetodid ---
+
+    def _pack(self, bool_array: np.ndarray) -> np.ndarray:
+        return np.packbits(np.asarray(bool_array, dtype=bool))
+
+    def _value_bitmaps(self, column: pd.Series | None) -> dict:
+        if column is None:
+            return {}
+        codes, uniques = pd.factorize(column, use_na_sentinel=True)
+        return {value: self._pack(codes == i) for i, value in enumerate(uniques)}
+
+    def _union(self, bitmaps) -> np.ndarray:
+        result = self._empty.copy()
+        for bm in bitmaps:
+            result |= bm
+        return result
+
+    def _values_union(self, table: dict, values) -> np.ndarray:
+        return self._union(table.get(v, self._empty) for v in values)
+
+    def eap_bitmap(self, lo: float, hi: float) -> np.ndarray:
+        """Bitmap kursustest, mille EAP on vahemikus [lo, hi]."""
+        start = np.searchsorted(self.eap_sorted, lo, side="left")
+        stop = np.searchsorted(self.eap_sorted, hi, side="right")
+        bools = np.zeros(self.n_rows, dtype=bool)
+        bools[self.eap_order[start:stop]] = True
+        return self._pack(bools)
+
+    # --- avalik liides ---
+
+    def bitmap(self, filters: dict) -> np.ndarray:
+        """Kombineerib filtrid üheks pakitud bitmapiks."""
+        result = self._all.copy()
+        eap_range = filters.get("eap_range")
+        if eap_range is not None:
+            result &= self.eap_bitmap(eap_range[0], eap_range[1])
+        if filters.get("semester_opts"):
+            result &= self._values_union(self.semester, filters["semester_opts"])
+        if filters.get("hindamis_opts"):
+            result &= self._values_union(self.hindamisviis, [HIND_MAP[h] for h in filters["hindamis_opts"]])
+        if filters.get("linn_opts"):
+            result &= self._union(self.linn[c] for c in filters["linn_opts"] if c in self.linn)
+        if filters.get("aste_opts"):
+            result &= self._union(self.oppeaste[a] for a in filters["aste_opts"] if a in self.oppeaste)
+        if filters.get("veeb_opts"):
+            result &= self._values_union(self.veebiope, filters["veeb_opts"])
+        if filters.get("no_prereqs"):
+            result &= self.no_prereqs
+        return result
+
+    def count(self, filters: dict | None = None, bitmap: np.ndarray | None = None) -> int:
+        """Filtritele vastavate kursuste arv ilma filtreeritud tabelit loomata."""
+        if bitmap is None:
+            bitmap = self.bitmap(filters or {})
+        return int(_POPCOUNT[bitmap].sum())
+
+    def mask(self, filters: dict | None = None, bitmap: np.ndarray | None = None) -> np.ndarray:
+        """Boolean-mask (pikkusega n_rows), sobib CourseIndex.search(mask=...) jaoks."""
+        if bitmap is None:
+            bitmap = self.bitmap(filters or {})
+        return np.unpackbits(bitmap, count=self.n_rows).astype(bool)
+
+
+# ---------------------------------------------------------------------------
+# Kontroll pandas-maskide vastu
+# ---------------------------------------------------------------------------
+
+# Filtri võti -> (valikud, andmestiku veerg)
+_FACET_COLUMNS = {
+    "semester_opts": (SEMESTER_OPTIONS, "semester"),
+    "hindamis_opts": (HINDAMIS_OPTIONS, "hindamisviis"),
+    "linn_opts": (LINN_OPTIONS, "linn"),
+    "aste_opts": (ASTE_OPTIONS, "oppeaste"),
+    "veeb_opts": (VEEB_OPTIONS, "veebiope"),
+}
+
+def _option_subsets(options, max_size=2):
+    subsets = [[]]
+    for size in range(1, max_size + 1):
+        subsets.extend(list(c) for c in itertools.combinations(options, size))
+    return subsets
+
+
+def verify(df: pd.DataFrame, n_random: int = 500, seed: int = 0) -> int:
+    """
+    Võrdleb FacetIndex-i maske ja loendeid pandas_filter_mask-iga:
+    iga filter eraldi kõigi ≤2 väärtuse kombinatsioonidega ning n_random
+    juhuslikku filtrite kombinatsiooni. Tagastab erinevuste arvu.
+    Filtrid, mille veergu andmestikus pole, jäetakse kontrollist välja.
+    """
+    facets = FacetIndex(df)
+    max_eap = float(df['eap'].max())
+    rng = random.Random(seed)
+
+    options = {key: opts for key, (opts, column) in _FACET_COLUMNS.items() if column in df.columns}
+    skipped = [column for key, (_, column) in _FACET_COLUMNS.items() if key not in options]
+    has_prereqs = "eeldusained" in df.columns
+    if not has_prereqs:
+        skipped.append("eeldusained")
+    if skipped:
+        print(f"Veerud puuduvad, jätan vastavad filtrid vahele: {', '.join(skipped)}")
+
+    cases = []
+    base = default_filters(max_eap)
+    for key, opts in options.items():
+        for subset in _option_subsets(opts):
+            cases.append({**base, key: subset})
+    if has_prereqs:
+        cases.append({**base, "no_prereqs": True})
+    for lo, hi in [(0.0, 3.0), (3.0, 6.0), (6.0, 6.0), (5.5, 30.0), (0.0, max_eap)]:
+        cases.append({**base, "eap_range": (lo, hi)})
+    for _ in range(n_random):
+        lo = float(rng.randint(0, int(max_eap)))
+        filters = {**base, "eap_range": (lo, float(rng.randint(int(lo), int(max_eap))))}
+        for key, opts in options.items():
+            filters[key] = rng.sample(opts, rng.randint(0, 3 if key == "linn_opts" else len(opts)))
+        filters["no_prereqs"] = has_prereqs and rng.random() < 0.3
+        cases.append(filters)
+
+    failures = 0
+    for filters in cases:
+        expected = pandas_filter_mask(df, filters).to_numpy()
+        got = facets.mask(filters)
+        if not np.array_equal(expected, got) or facets.count(filters) != int(expected.sum()):
+            failures += 1
+            print(f"  ERINEVUS: {filters}  pandas={int(expected.sum())}  facet={facets.count(filters)}")
+    print(f"Kontrollitud {len(cases)} filtrikombinatsiooni, erinevusi: {failures}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FacetIndex-i kontroll pandas-maskide vastu")
+    parser.add_argument("--verify", action="store_true", help="Võrdle tulemusi pandas-maskidega")
+    parser.add_argument("--csv", type=str, default=None,
+                        help="Kataloogi CSV (vaikimisi data/puhtad_andmed.csv)")
+    parser.add_argument("--random", type=int, default=500, help="Juhuslike kombinatsioonide arv")
+    args = parser.parse_args()
+
+    if args.csv is None:
+        from benchmark import COURSES_CSV
+        args.csv = COURSES_CSV
+    catalog = pd.read_csv(args.csv)
+    if args.verify:
+        raise SystemExit(1 if verify(catalog, n_random=args.random) else 0)
+    parser.print_help()
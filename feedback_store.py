@@ -0,0 +1,190 @@
+"""
+feedback_store.py – Kasutajate hinnangute hoidla (SQLite, WAL-režiim).
+
+Iga hinnang salvestatakse struktureeritult: konteksti ID-d ja nimed JSON-massiividena,
+filtrid sõnastikuna ning vastuse tokenid, kulu ja latentsus eraldi veergudes.
+Kirjutamine toimub ühes transaktsioonis, nii et mitu Streamliti seanssi võivad
+korraga hinnanguid saata.
+
+Samas transaktsioonis uuendatakse koondtabelit feedback_agg (hinnang x veatüüp),
+millest vigade analüüsi tabel tuleb ilma kogu ajalugu uuesti lugemata.
+
+Käivitamine:
+    python feedback_store.py                           # veatüüpide tabel
+    python feedback_store.py --import-csv tagasiside_log.csv
+"""
+
+import argparse
+import ast
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+FEEDBACK_DB = "tagasiside.sqlite"
+LEGACY_FEEDBACK_CSV = "tagasiside_log.csv"
+
+RATING_GOOD = "👍 Hea"
+RATING_BAD = "👎 Halb"
+RATING_OPTIONS = [RATING_GOOD, RATING_BAD]
+ERROR_CATEGORIES = [
+    "Filtrid olid liiga karmid/valed",
+    "Otsing leidis valed ained (RAG viga)",
+    "LLM hallutsineeris/vastas valesti",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT,
+    session_id TEXT,
+    prompt TEXT,
+    filters TEXT,
+    context_ids TEXT,
+    context_names TEXT,
+    response TEXT,
+    rating TEXT,
+    error_category TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cost REAL,
+    ttft_s REAL,
+    llm_time_s REAL
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_created_at ON feedback (created_at);
+CREATE TABLE IF NOT EXISTS feedback_agg (
+    rating TEXT,
+    error_category TEXT,
+    count INTEGER,
+    PRIMARY KEY (rating, error_category)
+);
+"""
+
+
+class FeedbackStore:
+    """Lõimekindel hinnangute hoidla; Streamliti seansid jagavad ühte objekti."""
+
+    def __init__(self, db_path: str = FEEDBACK_DB):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    def log(self, prompt: str, filters: dict | str, context_ids: list, context_names: list,
+            response: str, rating: str, error_category: str = "", session_id: str | None = None,
+            llm: dict | None = None, created_at: str | None = None):
+        """
+        Salvestab ühe hinnangu. llm – valikuline sõnastik võtmetega input_tokens,
+        output_tokens, cost, ttft_s, total_s (vastuse kulu ja latentsus).
+        """
+        llm = llm or {}
+        row = (
+            created_at or time.strftime("%Y-%m-%d %H:%M:%S"),
+            session_id,
+            prompt,
+            json.dumps(filters, ensure_ascii=False, default=str),
+            json.dumps([str(i) for i in context_ids], ensure_ascii=False),
+            json.dumps([str(n) for n in context_names], ensure_ascii=False),
+            response,
+            rating,
+            error_category or "",
+            llm.get("input_tokens"),
+            llm.get("output_tokens"),
+            llm.get("cost"),
+            llm.get("ttft_s"),
+            llm.get("total_s"),
+        )
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO feedback (created_at, session_id, prompt, filters, context_ids, context_names,"
+                " response, rating, error_category, input_tokens, output_tokens, cost, ttft_s, llm_time_s)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row,
+            )
+            self._db.execute(
+                "INSERT INTO feedback_agg (rating, error_category, count) VALUES (?, ?, 1)"
+                " ON CONFLICT(rating, error_category) DO UPDATE SET count = count + 1",
+                (rating, error_category or ""),
+            )
+
+    # --- analüüs ---
+
+    def counts(self) -> dict[tuple[str, str], int]:
+        """{(hinnang, veatüüp): arv} koondtabelist."""
+        with self._lock:
+            rows = self._db.execute("SELECT rating, error_category, count FROM feedback_agg").fetchall()
+        return {(r[0], r[1]): r[2] for r in rows}
+
+    def error_breakdown(self, rating: str = RATING_BAD) -> pd.DataFrame:
+        """
+        Veatüüpide tabel (Veatüüp, Arv, % koguarvust) valitud hinnanguga vastuste kohta,
+        nagu notebooks/vigade_analüüs.ipynb. Kõik ERROR_CATEGORIES on tabelis ka nulliga.
+        """
+        counts = {cat: n for (r, cat), n in self.counts().items() if r == rating}
+        for cat in ERROR_CATEGORIES:
+            counts.setdefault(cat, 0)
+        total = sum(counts.values())
+        table = pd.DataFrame(
+            sorted(counts.items(), key=lambda kv: -kv[1]), columns=["Veatüüp", "Arv"]
+        )
+        table["% koguarvust"] = (table["Arv"] / total * 100).round(2) if total > 0 else 0.0
+        return table
+
+    def to_frame(self, since: str | None = None) -> pd.DataFrame:
+        """Hinnangud DataFrame'ina (JSON-väljad lahti pakitud); since – alates ajast created_at."""
+        query = "SELECT * FROM feedback"
+        params = ()
+        if since:
+            query += " WHERE created_at >= ?"
+            params = (since,)
+        with self._lock:
+            df = pd.read_sql_query(query + " ORDER BY id", self._db, params=params)
+        for col in ("filters", "context_ids", "context_names"):
+            df[col] = df[col].map(lambda v: json.loads(v) if v else None)
+        return df
+
+    # --- vana CSV import ---
+
+    def import_csv(self, csv_path: str = LEGACY_FEEDBACK_CSV) -> int:
+        """Impordib vana tagasiside_log.csv (str(list) kujul ID-dega) hoidlasse."""
+
+        def parse_list(value):
+            try:
+                parsed = ast.literal_eval(value)
+                return list(parsed) if isinstance(parsed, (list, tuple)) else []
+            except (ValueError, SyntaxError):
+                return []
+
+        n = 0
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for rec in csv.DictReader(f):
+                self.log(
+                    prompt=rec.get("Kasutaja päring", ""),
+                    filters=rec.get("Filtrid", ""),
+                    context_ids=parse_list(rec.get("Leitud ID-d", "[]")),
+                    context_names=parse_list(rec.get("Leitud ained", "[]")),
+                    response=rec.get("LLM Vastus", ""),
+                    rating=rec.get("Hinnang", ""),
+                    error_category=rec.get("Veatüüp", ""),
+                    created_at=rec.get("Aeg") or None,
+                )
+                n += 1
+        return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tagasiside hoidla")
+    parser.add_argument("--db", type=str, default=FEEDBACK_DB, help="SQLite fail")
+    parser.add_argument("--import-csv", type=str, default=None, help="Impordi vana tagasiside CSV")
+    args = parser.parse_args()
+
+    store = FeedbackStore(args.db)
+    if args.import_csv:
+        print(f"Imporditud {store.import_csv(args.import_csv)} hinnangut.")
+    print(store.error_breakdown().to_string(index=False))
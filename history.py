@@ -0,0 +1,111 @@
+"""
+history.py – Vestluse ajaloo aken tokenieelarve piires.
+
+LLM-ile saadetakse viimased sõnumid, mis mahuvad eelarvesse (viimane sõnum
+alati). Vanemad sõnumid volditakse lühikeseks kokkuvõtteks: iga sõnumi kohta
+üks rida (esimene lause, kärbitud). Kokkuvõte hoitakse seansi olekus ja seda
+täiendatakse ainult äsja välja langenud sõnumitega, nii et iga pöörde juures
+kogu ajalugu uuesti ei töödelda.
+"""
+
+import re
+from dataclasses import dataclass
+
+from llm_client import TOKENS_PER_MESSAGE, estimate_tokens
+
+DEFAULT_HISTORY_BUDGET = 1000   # viimaste sõnumite tokenid
+DEFAULT_SUMMARY_BUDGET = 300    # kokkuvõtte tokenid
+SUMMARY_LINE_CHARS = 160
+
+ROLE_LABELS = {"user": "Kasutaja", "assistant": "Assistent"}
+SUMMARY_HEADER = "Varasema vestluse kokkuvõte (vanemad sõnumid, lühendatud):"
+
+
+@dataclass
+class HistoryWindow:
+    messages: list[dict]      # kokkuvõtte sõnum (kui on) + viimased sõnumid
+    recent_tokens: int        # viimaste sõnumite tokenid
+    summary_tokens: int       # kokkuvõtte tokenid
+    recent_count: int         # mitu sõnumit saadeti täismahus
+    folded_count: int         # mitu sõnumit on kokkuvõttes
+
+    @property
+    def total_tokens(self) -> int:
+        return self.recent_tokens + self.summary_tokens
+
+    def as_debug(self) -> dict:
+        return {
+            "recent_tokens": self.recent_tokens,
+            "summary_tokens": self.summary_tokens,
+            "total_tokens": self.total_tokens,
+            "recent_count": self.recent_count,
+            "folded_count": self.folded_count,
+        }
+
+
+def new_summary_state() -> dict:
+    """Seansi olekusse salvestatav kokkuvõtte vahemälu."""
+    return {"folded": 0, "lines": [], "dropped": 0}
+
+
+def message_tokens(message: dict) -> int:
+    return estimate_tokens(message.get("content") or "") + TOKENS_PER_MESSAGE
+
+
+def summarize_message(message: dict) -> str:
+    """Üks rida sõnumi kohta: roll ja esimene lause (kärbitud)."""
+    text = " ".join((message.get("content") or "").split())
+    first = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first) > SUMMARY_LINE_CHARS:
+        first = first[:SUMMARY_LINE_CHARS].rsplit(" ", 1)[0] + " …"
+    return f"- {ROLE_LABELS.get(message['role'], message['role'])}: {first}"
+
+
+def _summary_text(state: dict) -> str:
+    lines = state["lines"]
+    if state["dropped"]:
+        lines = [f"- (… {state['dropped']} vanemat sõnumit välja jäetud)"] + lines
+    return SUMMARY_HEADER + "\n" + "\n".join(lines)
+
+
+def build_history_window(history: list[dict], state: dict,
+                         budget: int = DEFAULT_HISTORY_BUDGET,
+                         summary_budget: int = DEFAULT_SUMMARY_BUDGET) -> HistoryWindow:
+    """
+    history – sõnumid vanimast uusimani ({"role", "content"}), viimane on praegune päring.
+    state   – new_summary_state() sõnastik seansi olekust; muudetakse kohapeal.
+    """
+    # Viimased sõnumid eelarve piires (uusim alati kaasas)
+    split = len(history)
+    recent_tokens = 0
+    for i in range(len(history) - 1, -1, -1):
+        cost = message_tokens(history[i])
+        if split < len(history) and recent_tokens + cost > budget:
+            break
+        recent_tokens += cost
+        split = i
+
+    # Kokkuvõte kasvab ainult edasi: kord volditud sõnumit aknasse tagasi ei tooda
+    if state["folded"] > len(history):
+        state.update(new_summary_state())
+    if split < state["folded"]:
+        split = state["folded"]
+        recent_tokens = sum(message_tokens(m) for m in history[split:])
+
+    # Lisame kokkuvõttesse ainult äsja välja langenud sõnumid
+    for message in history[state["folded"]:split]:
+        state["lines"].append(summarize_message(message))
+    state["folded"] = split
+    while len(state["lines"]) > 1 and estimate_tokens(_summary_text(state)) > summary_budget:
+        state["lines"].pop(0)
+        state["dropped"] += 1
+
+    messages = [{"role": m["role"], "content": m["content"]} for m in history[split:]]
+    summary_tokens = 0
+    if state["lines"]:
+        summary = {"role": "system", "content": _summary_text(state)}
+        summary_tokens = message_tokens(summary)
+        messages.insert(0, summary)
+
+    return HistoryWindow(messages=messages, recent_tokens=recent_tokens, summary_tokens=summary_tokens,
+                         recent_count=len(history) - split, folded_count=split)
@@ -0,0 +1,262 @@
+"""
+lexical_index.py – BM25 pöördindeks kursuste tabelile ja hübriidotsing.
+
+Indekseeritavad väljad (kaaluga): unique_ID, nimi_et, kirjeldus. Eesti keele
+jaoks kasutatakse kerget normaliseerimist: väiketähed, sõnad \\w+, levinumate
+käändelõppude eemaldamine ja sõna kärpimine STEM_CHARS tähemärgini (liitsõnad
+ja vormid nagu "arvutimängude" / "arvutimänge" langevad kokku).
+
+Otsingu režiimid (Retriever.search):
+    dense    – ainult vektorotsing (CourseIndex), ilma koodi kiirteeta (puhas baasjoon)
+    lexical  – ainult BM25, embedderit ei kutsuta
+    hybrid   – BM25 ja vektorotsingu järjestused liidetakse (reciprocal rank fusion)
+
+Kui päringus on kursuse kood (nt LTAT.03.001) või see on täpselt kursuse nimi,
+leitakse kursus hybrid- ja lexical-režiimis sõnastikust ja embedderit ei kutsuta.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from course_index import CourseIndex, top_positions
+from timing import SpanRecorder, span
+
+RETRIEVAL_DENSE = "dense"
+RETRIEVAL_LEXICAL = "lexical"
+RETRIEVAL_HYBRID = "hybrid"
+RETRIEVAL_MODES = (RETRIEVAL_DENSE, RETRIEVAL_LEXICAL, RETRIEVAL_HYBRID)
+DEFAULT_RETRIEVAL_MODE = RETRIEVAL_HYBRID
+
+FIELD_WEIGHTS = {"unique_ID": 3.0, "nimi_et": 2.0, "kirjeldus": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+# Mitu kandidaati kummastki järjestusest liitmisse võetakse (k * factor)
+FUSION_DEPTH_FACTOR = 4
+
+STEM_CHARS = 7
+MIN_STEM_CHARS = 4
+# Pikemad lõpud enne lühemaid
+SUFFIXES = tuple(sorted((
+    "dega", "tega", "test", "dest", "tele", "dele", "sse", "des", "tes", "ga", "st", "lt", "le",
+    "ks", "ni", "na", "ta", "te", "de", "id", "ud", "il", "is", "l", "s", "d", "t",
+), key=len, reverse=True))
+STOPWORDS = frozenset("""
+    ja ning ka et kas on ei ole oli mis mida kus kes see seda need neid ma mina sa sina
+    ta tema me meie te teie nad nemad oma mul sul tal või aga kui siis veel väga kõik
+    ainet aine aineid ained kursus kursust kursusi kursused kursuse tahan soovin
+    õppida otsin midagi kohta saan mingi mõni mõnda
+""".split())
+
+COURSE_CODE_RE = re.compile(r"\b([A-Za-z0-9]{2,6})\.(\d{2})\.(\d{3})\b")
+
+
+def normalize_text(text: str) -> str:
+    return unicodedata.normalize("NFC", str(text)).lower()
+
+
+def stem(token: str) -> str:
+    for suffix in SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_CHARS:
+            token = token[: -len(suffix)]
+            break
+    return token[:STEM_CHARS]
+
+
+def tokenize(text: str) -> list[str]:
+    """Väiketähtedes tüvede list (stoppsõnad ja üksikud tähed välja jäetud)."""
+    tokens = []
+    for word in re.findall(r"\w+", normalize_text(text)):
+        if len(word) < 2 or word in STOPWORDS:
+            continue
+        tokens.append(word if word.isdigit() else stem(word))
+    return tokens
+
+
+def find_course_codes(text: str) -> list[str]:
+    """Päringus mainitud kursuse koodid suurtähtedes (kordusteta, esinemise järjekorras)."""
+    codes = [".".join(m.groups()).upper() for m in COURSE_CODE_RE.finditer(str(text))]
+    return list(dict.fromkeys(codes))
+
+
+def rrf_fuse(rankings: list[np.ndarray], k: int, rrf_k: int = RRF_K) -> tuple[np.ndarray, np.ndarray]:
+    """Reciprocal rank fusion: skoor = sum(1 / (rrf_k + koht)); tagastab (positsioonid, skoorid)."""
+    fused: dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, position in enumerate(ranking.tolist(), start=1):
+            fused[position] += 1.0 / (rrf_k + rank)
+    if not fused:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    positions = np.fromiter(fused.keys(), dtype=np.int64, count=len(fused))
+    scores = np.fromiter(fused.values(), dtype=np.float32, count=len(fused))
+    top, top_scores = top_positions(scores, k)
+    return positions[top], top_scores
+
+
+class LexicalIndex:
+    """
+    BM25 indeks; rida i vastab reale i tabelis df (ehita CourseIndex.df peal,
+    et positsioonid oleksid vektorotsinguga joondatud).
+    """
+
+    def __init__(self, df: pd.DataFrame, field_weights: dict[str, float] = FIELD_WEIGHTS,
+                 k1: float = BM25_K1, b: float = BM25_B):
+        self.n_docs = len(df)
+        self.k1 = k1
+        self.b = b
+
+        # Koodi ja täpse nime kiirtee
+        self.code_positions: dict[str, int] = {}
+        for position, course_id in enumerate(df["unique_ID"].astype(str)):
+            self.code_positions.setdefault(course_id.upper(), position)
+        self.title_positions: dict[str, list[int]] = defaultdict(list)
+        if "nimi_et" in df.columns:
+            for position, title in enumerate(df["nimi_et"].fillna("").astype(str)):
+                if title:
+                    self.title_positions[" ".join(normalize_text(title).split())].append(position)
+
+        # Kaalutud terminisagedused (BM25F lihtsustus: väljad liidetakse kaaludega)
+        postings: dict[str, list[tuple[int, float]]] = defaultdict(list)
+        lengths = np.zeros(self.n_docs, dtype=np.float32)
+        columns = [(c, w) for c, w in field_weights.items() if c in df.columns]
+        for position, values in enumerate(zip(*(df[c].fillna("").astype(str) for c, _ in columns))):
+            tf: Counter = Counter()
+            for (column, weight), value in zip(columns, values):
+                tokens = [value.lower()] if column == "unique_ID" else tokenize(value)
+                for token in tokens:
+                    tf[token] += weight
+            lengths[position] = sum(tf.values())
+            for token, freq in tf.items():
+                postings[token].append((position, freq))
+
+        avg_length = float(lengths.mean()) if self.n_docs else 1.0
+        self._norm = (k1 * (1 - b + b * lengths / max(avg_length, 1e-9))).astype(np.float32)
+        self.postings: dict[str, tuple[np.ndarray, np.ndarray, float]] = {}
+        for token, entries in postings.items():
+            docs = np.fromiter((p for p, _ in entries), dtype=np.int64, count=len(entries))
+            freqs = np.fromiter((f for _, f in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (self.n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[token] = (docs, freqs, idf)
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def exact_matches(self, query: str) -> list[int]:
+        """Koodi või täpse nime järgi leitud positsioonid (tühi list, kui ei leitud)."""
+        positions = [self.code_positions[c] for c in find_course_codes(query) if c in self.code_positions]
+        if not positions:
+            positions = list(self.title_positions.get(" ".join(normalize_text(query).split()), []))
+        return positions
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for token in set(tokenize(query)):
+            entry = self.postings.get(token)
+            if entry is None:
+                continue
+            docs, freqs, idf = entry
+            scores[docs] += idf * freqs * (self.k1 + 1) / (freqs + self._norm[docs])
+        return scores
+
+    def search(self, query: str, k: int = 5,
+               mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """(positsioonid, BM25 skoorid); nullskooriga ridu ei tagastata."""
+        scores = self.scores(query)
+        nonzero = scores > 0
+        positions, top_scores = top_positions(scores, k, nonzero if mask is None else nonzero & mask)
+        return positions, top_scores
+
+
+@dataclass
+class RetrievalResult:
+    positions: np.ndarray
+    scores: np.ndarray
+    route: str                        # "code", "dense", "lexical" või "hybrid"
+    embedded: bool = False            # kas embedderit kutsuti
+    query_cache_source: str | None = None
+    query_vec: np.ndarray | None = None   # päringuvektor (dense/hybrid), nt answer_cache jaoks
+
+
+class Retriever:
+    """
+    Ühendab CourseIndex'i (vektorid), LexicalIndex'i (BM25) ja embedderi.
+
+        retriever = Retriever(course_index, lexical_index, embedder)
+        result = retriever.search("LTAT.03.001", k=5, mask=mask, mode="hybrid")
+        course_index.rows(result.positions)
+    """
+
+    def __init__(self, course_index: CourseIndex, lexical_index: LexicalIndex, embedder=None):
+        """embedder võib olla None (või määratakse hiljem); siis otsitakse ainult BM25-ga."""
+        if len(course_index) != len(lexical_index):
+            raise ValueError(f"Vektorindeksis {len(course_index)} rida, leksikaalses {len(lexical_index)}.")
+        self.course_index = course_index
+        self.lexical_index = lexical_index
+        self.embedder = embedder
+
+    def _encode(self, query: str) -> tuple[np.ndarray, str | None]:
+        if hasattr(self.embedder, "encode_query"):
+            return self.embedder.encode_query(query)
+        return np.asarray(self.embedder.encode([query]), dtype=np.float32)[0], None
+
+    def search(self, query: str, k: int = 5, mask: np.ndarray | None = None,
+               mode: str = DEFAULT_RETRIEVAL_MODE, query_vec: np.ndarray | None = None,
+               timer: SpanRecorder | None = None) -> RetrievalResult:
+        """
+        query_vec – valikuline eelarvutatud päringuvektor (nt benchmarki partiist).
+        timer     – valikuline SpanRecorder: etapid "encode" ja "search".
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Tundmatu otsingurežiim: {mode!r} (lubatud: {', '.join(RETRIEVAL_MODES)})")
+
+        # Kiirtee: kood või täpne nimi, filtrid kehtivad (dense jääb puhtaks vektorotsinguks)
+        with span(timer, "search"):
+            exact = [] if mode == RETRIEVAL_DENSE else \
+                [p for p in self.lexical_index.exact_matches(query) if mask is None or mask[p]]
+            if exact:
+                exact = np.asarray(exact[:k], dtype=np.int64)
+                positions = exact
+                if len(exact) < k:
+                    # Ülejäänud kohad BM25-ga, ikka ilma embedderita
+                    rest_mask = np.ones(len(self.lexical_index), dtype=bool) if mask is None else mask.copy()
+                    rest_mask[exact] = False
+                    rest, _ = self.lexical_index.search(query, k - len(exact), rest_mask)
+                    positions = np.concatenate([exact, rest])
+                return RetrievalResult(positions, np.ones(len(positions), dtype=np.float32), route="code")
+
+            # Embedder pole veel laaditud (soojendus): BM25 on parim, mis kohe olemas on
+            if mode == RETRIEVAL_LEXICAL or (query_vec is None and self.embedder is None):
+                positions, scores = self.lexical_index.search(query, k, mask)
+                return RetrievalResult(positions, scores, route=RETRIEVAL_LEXICAL)
+
+        source = None
+        if query_vec is None:
+            with span(timer, "encode"):
+                query_vec, source = self._encode(query)
+        with span(timer, "search"):
+            if mode == RETRIEVAL_DENSE:
+                positions, scores = self.course_index.search(query_vec, k, mask)
+                return RetrievalResult(positions, scores, route=RETRIEVAL_DENSE, embedded=True,
+                                       query_cache_source=source, query_vec=query_vec)
+
+            depth = k * FUSION_DEPTH_FACTOR
+            dense, _ = self.course_index.search(query_vec, depth, mask)
+            lexical, _ = self.lexical_index.search(query, depth, mask)
+            positions, scores = rrf_fuse([dense, lexical], k)
+        return RetrievalResult(positions, scores, route=RETRIEVAL_HYBRID, embedded=True,
+                               query_cache_source=source, query_vec=query_vec)
+
+    def top_k(self, query: str, k: int = 5, mask: np.ndarray | None = None,
+              mode: str = DEFAULT_RETRIEVAL_MODE, query_vec: np.ndarray | None = None,
+              timer: SpanRecorder | None = None) -> tuple[pd.DataFrame, RetrievalResult]:
+        """Nagu search(), kuid tagastab ka kursuste read koos 'score' veeruga."""
+        result = self.search(query, k=k, mask=mask, mode=mode, query_vec=query_vec, timer=timer)
+        results = self.course_index.rows(result.positions)
+        results["score"] = result.scores
+        return results, result
@@ -0,0 +1,235 @@
+"""
+llm_client.py – Ühine LLM-i kliendikiht rakendusele (ois-projekt.py) ja benchmarkile.
+
+Iga vastus genereeritakse ühe voogedastatud päringuga. Tokenite kasutus loetakse
+voo viimasest tükist (stream_options.include_usage); kui teenusepakkuja seda ei
+saada, hinnatakse tokenid kohaliku tokeniseerijaga. Lisaks mõõdetakse aega
+esimese tokenini (TTFT) ja kogu genereerimise aega.
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # openai imporditakse alles kliendi loomisel (kiirem külmkäivitus)
+    from openai import OpenAI
+
+# ---------------------------------------------------------------------------
+# Konfiguratsioon
+# ---------------------------------------------------------------------------
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+LLM_MODEL = "google/gemma-3-27b-it"
+COST_PER_INPUT_M = 0.04    # $ per 1M tokens
+COST_PER_OUTPUT_M = 0.15   # $ per 1M tokens
+
+# Lisatokenid iga sõnumi rolli ja eraldajate jaoks (hinnangu korral)
+TOKENS_PER_MESSAGE = 4
+
+
+# ---------------------------------------------------------------------------
+# Tokenite hindamine
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """Tagastab tiktoken'i kodeeringu, kui teek on paigaldatud, muidu None."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Hindab teksti tokenite arvu kohalikult. Kasutab tiktoken'it, kui see on
+    saadaval, muidu ligikaudset reeglit ~4 tähemärki tokeni kohta.
+    """
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text))
+    return max(1, round(len(text) / 4))
+
+
+def estimate_message_tokens(messages: list[dict]) -> int:
+    """Hindab chat-sõnumite listi sisendtokenite arvu."""
+    return sum(estimate_tokens(m.get("content") or "") + TOKENS_PER_MESSAGE for m in messages)
+
+
+def compute_cost(input_tokens: int, output_tokens: int) -> float:
+    return (input_tokens * COST_PER_INPUT_M + output_tokens * COST_PER_OUTPUT_M) / 1_000_000
+
+
+# ---------------------------------------------------------------------------
+# Klient ja voogedastus
+# ---------------------------------------------------------------------------
+
+def make_client(api_key: str) -> "OpenAI":
+    from openai import OpenAI
+    return OpenAI(base_url=OPENROUTER_BASE_URL, api_key=api_key)
+
+
+@dataclass
+class LLMResult:
+    text: str
+    input_tokens: int
+    output_tokens: int
+    cost: float
+    ttft_s: float | None       # aeg esimese sisutokenini (sekundites)
+    total_s: float             # kogu genereerimise aeg (sekundites)
+    usage_estimated: bool      # True, kui tokenid on hinnatud kohalikult
+    cached: bool = False       # True, kui vastus tuli completion_cache'ist
+
+
+class ChatStream:
+    """
+    Itereeritav LLM-i vastuse voog. Annab välja tekstitükke (sobib otse
+    st.write_stream'ile) ja pärast voo lõppu on self.result-is LLMResult.
+
+    Kasutus:
+        stream = ChatStream(client, messages)
+        for piece in stream: ...
+        stream.result.input_tokens
+
+    cache – valikuline completion_cache.CompletionCache; tabamuse korral API-t
+    ei kutsuta ja tulemus (koos salvestatud kasutuse ja ajastusega) tuleb vahemälust.
+    """
+
+    def __init__(self, client: "OpenAI", messages: list[dict], model: str = LLM_MODEL, cache=None):
+        self.client = client
+        self.messages = messages
+        self.model = model
+        self.cache = cache
+        self.result: LLMResult | None = None
+
+    def __iter__(self):
+        if self.cache is not None:
+            cached = self.cache.get(self.model, self.messages)
+            if cached is not None:
+                self.result = cached
+                if cached.text:
+                    yield cached.text
+                return
+
+        t0 = time.perf_counter()
+        stream = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        parts = []
+        usage = None
+        ttft = None
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                parts.append(delta)
+                yield delta
+        total = time.perf_counter() - t0
+
+        text = "".join(parts)
+        if usage is not None and usage.prompt_tokens is not None:
+            input_tokens = usage.prompt_tokens
+            output_tokens = usage.completion_tokens or 0
+            estimated = False
+        else:
+            input_tokens = estimate_message_tokens(self.messages)
+            output_tokens = estimate_tokens(text)
+            estimated = True
+
+        self.result = LLMResult(
+            text=text,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cost=compute_cost(input_tokens, output_tokens),
+            ttft_s=ttft,
+            total_s=total,
+            usage_estimated=estimated,
+        )
+        if self.cache is not None:
+            self.cache.put(self.model, self.messages, self.result)
+
+
+def complete(client: "OpenAI", messages: list[dict], model: str = LLM_MODEL, cache=None) -> LLMResult:
+    """Küsib vastuse voona, kogub selle kokku ja tagastab LLMResult-i."""
+    stream = ChatStream(client, messages, model=model, cache=cache)
+    for _ in stream:
+        pass
+    return stream.result
+
+
+# ---------------------------------------------------------------------------
+# Kiiruspiirang ja korduskatsed
+# ---------------------------------------------------------------------------
+
+class TokenBucket:
+    """
+    Lõimekindel token bucket: keskmiselt `rate` päringut sekundis, hetkeliselt
+    kuni `burst` päringut järjest. acquire() blokeerib, kuni token on saadaval.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate peab olema positiivne")
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """429 (rate limit), 408 ja 5xx vead ning ühenduse katkemised on ajutised."""
+    status = getattr(exc, "status_code", None)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    from openai import APIConnectionError
+    return isinstance(exc, APIConnectionError)
+
+
+def call_with_retries(fn, max_retries: int = 4, base_delay: float = 1.0, max_delay: float = 30.0,
+                      rate_limiter: TokenBucket | None = None, on_retry=None):
+    """
+    Kutsub fn() ja kordab ajutiste vigade korral eksponentsiaalse ooteajaga
+    (full jitter: juhuslik 0 .. base_delay * 2^katse). Enne iga katset võetakse
+    token rate_limiter'ist. on_retry(katse, viga, ooteaeg) kutsutakse enne ootamist.
+    """
+    attempt = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            attempt += 1
+            if on_retry is not None:
+                on_retry(attempt, e, delay)
+            time.sleep(delay)
@@ -0,0 +1,151 @@
+"""
+query_cache.py – Kahetasemeline päringuvektorite vahemälu embedderi ümber.
+
+1. tase: protsessisisene LRU (OrderedDict), piiratud suurusega.
+2. tase: püsiv SQLite võti -> vektor hoidla, kus on kirjas ka mudeli nimi;
+   mudeli vahetumisel hoidla tühjendatakse.
+
+Võti on normaliseeritud päringutekst (Unicode NFC, tühikud kokku, väiketähed),
+nii et "Tahan õppida  Masinõpet " ja "tahan õppida masinõpet" jagavad vektorit.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_DIR = "cache"
+QUERY_CACHE_DB = os.path.join(CACHE_DIR, "query_embeddings.sqlite")
+
+# Vahemälu tabamuse allikad
+SOURCE_MEMORY = "mälu"
+SOURCE_DISK = "ketas"
+SOURCE_MODEL = "mudel"
+
+
+def normalize_query(text: str) -> str:
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class CachedEmbedder:
+    """
+    SentenceTransformer'i ümbris: encode(list[str]) -> np.ndarray nagu originaalil,
+    kuid vektorid tulevad võimalusel vahemälust. Lõimekindel (Streamliti seansid
+    jagavad sama objekti get_models() kaudu).
+    """
+
+    def __init__(self, embedder, model_name: str, db_path: str | None = QUERY_CACHE_DB,
+                 max_memory_items: int = 2048):
+        self.embedder = embedder
+        self.model_name = model_name
+        self.max_memory_items = max_memory_items
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB)")
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'model'").fetchone()
+            if row is None or row[0] != model_name:
+                # Teise mudeli vektorid ei sobi – tühjendame hoidla
+                self._db.execute("DELETE FROM vectors")
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model', ?)", (model_name,))
+            self._db.commit()
+
+    # --- sisemised abimeetodid ---
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> tuple[np.ndarray | None, str]:
+        vector = self._memory.get(key)
+        if vector is not None:
+            self._memory.move_to_end(key)
+            return vector, SOURCE_MEMORY
+        if self._db is not None:
+            row = self._db.execute("SELECT vector FROM vectors WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32).copy()
+                self._remember(key, vector)
+                return vector, SOURCE_DISK
+        return None, SOURCE_MODEL
+
+    # --- avalik liides ---
+
+    def encode_with_sources(self, texts: list[str], **kwargs) -> tuple[np.ndarray, list[str]]:
+        """
+        Nagu encode(), kuid tagastab ka iga päringu vektori allika
+        (SOURCE_MEMORY / SOURCE_DISK / SOURCE_MODEL). Puuduvad vektorid
+        arvutatakse ühe partiina.
+        """
+        keys = [normalize_query(t) for t in texts]
+        vectors: list[np.ndarray | None] = [None] * len(texts)
+        sources = [SOURCE_MODEL] * len(texts)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vectors[i], sources[i] = self._lookup(key)
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if vectors[i] is None:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            first_texts = [texts[idx[0]] for idx in missing.values()]
+            encoded = np.asarray(self.embedder.encode(first_texts, **kwargs), dtype=np.float32)
+            with self._lock:
+                for (key, idx), vector in zip(missing.items(), encoded):
+                    for i in idx:
+                        vectors[i] = vector
+                    self._remember(key, vector)
+                    if self._db is not None:
+                        self._db.execute("INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)",
+                                         (key, vector.tobytes()))
+                if self._db is not None:
+                    self._db.commit()
+
+        with self._lock:
+            for source in sources:
+                if source == SOURCE_MEMORY:
+                    self.stats["memory_hits"] += 1
+                elif source == SOURCE_DISK:
+                    self.stats["disk_hits"] += 1
+                else:
+                    self.stats["misses"] += 1
+
+        return np.stack(vectors) if vectors else np.empty((0, 0), dtype=np.float32), sources
+
+    def encode(self, texts: list[str], **kwargs) -> np.ndarray:
+        return self.encode_with_sources(texts, **kwargs)[0]
+
+    def encode_query(self, text: str) -> tuple[np.ndarray, str]:
+        """Üks päring: (vektor, allikas)."""
+        vectors, sources = self.encode_with_sources([text])
+        return vectors[0], sources[0]
+
+    def stats_summary(self) -> dict:
+        with self._lock:
+            s = dict(self.stats)
+        total = s["memory_hits"] + s["disk_hits"] + s["misses"]
+        s["total"] = total
+        s["hit_rate"] = (s["memory_hits"] + s["disk_hits"]) / total if total else 0.0
+        return s
+
+    def __getattr__(self, name):
+        # Muud atribuudid (nt tokenizer, get_sentence_embedding_dimension) tulevad embedderilt
+        if name == "embedder":
+            raise AttributeError(name)
+        return getattr(self.embedder, name)
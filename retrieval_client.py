@@ -0,0 +1,138 @@
+"""
+retrieval_client.py – Õhuke klient retrieval_server.py jaoks.
+
+Klient hoiab iga lõime kohta ühte püsivat HTTP/1.1 ühendust (keep-alive), nii
+et päringud ei ava iga kord uut TCP ühendust. encode() / encode_query() /
+stats_summary() on samad nagu CachedEmbedder'il, seega saab klienti kasutada
+embedderi asemel (rakendus ja benchmark, kui RETRIEVAL_SERVER_URL on seatud):
+
+    client = RetrievalClient("http://127.0.0.1:8765")
+    client.wait_until_ready()
+    vectors = client.encode(["masinõpe"])
+    results_df, info = client.search("masinõpe", filters={"semester_opts": ["kevad"]}, k=5)
+"""
+
+import base64
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_SERVER_URL = "http://127.0.0.1:8765"
+DEFAULT_TIMEOUT_S = 60.0
+
+
+class RetrievalServerError(RuntimeError):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+def decode_vectors(payload: dict) -> np.ndarray:
+    """/embed vastus -> float32 maatriks (base64 või JSON listid)."""
+    if "data" in payload:
+        raw = base64.b64decode(payload["data"])
+        return np.frombuffer(raw, dtype=np.float32).reshape(payload["shape"]).copy()
+    return np.asarray(payload["vectors"], dtype=np.float32)
+
+
+class RetrievalClient:
+    def __init__(self, url: str = DEFAULT_SERVER_URL, timeout: float = DEFAULT_TIMEOUT_S):
+        parts = urlsplit(url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"Vigane serveri aadress: {url!r} (oodatud http://host:port)")
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # --- ühendus ---
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def _request(self, method: str, path: str, body: dict | None = None) -> dict:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        # Server võib jõudeoleku ühenduse sulgeda: üks uus katse värske ühendusega
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=data, headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                    http.client.CannotSendRequest):
+                self._reset()
+                if attempt == 1:
+                    raise
+        if response.will_close:
+            self._reset()
+        result = json.loads(payload.decode("utf-8")) if payload else {}
+        if response.status >= 400:
+            raise RetrievalServerError(response.status, result.get("error", response.reason))
+        return result
+
+    def close(self):
+        self._reset()
+
+    # --- API ---
+
+    def health(self) -> dict:
+        return self._request("GET", "/health")
+
+    def wait_until_ready(self, timeout: float = 600.0, poll_s: float = 0.5) -> dict:
+        """Ootab, kuni server on mudeli laadinud; tagastab /health vastuse."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                health = self.health()
+                if health.get("status") == "ok":
+                    return health
+                if health.get("status") == "failed":
+                    raise RuntimeError(f"Otsinguserveri soojendus ebaõnnestus: {health.get('error')}")
+            except (ConnectionError, OSError):
+                self._reset()
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Otsinguserver {self.url} ei saanud {timeout:.0f} s jooksul valmis.")
+            time.sleep(poll_s)
+
+    def embed_with_sources(self, texts: list[str]) -> tuple[np.ndarray, list[str]]:
+        payload = self._request("POST", "/embed", {"texts": list(texts), "format": "base64"})
+        return decode_vectors(payload), payload.get("sources", [])
+
+    def encode(self, texts: list[str], **kwargs) -> np.ndarray:
+        return self.embed_with_sources(texts)[0]
+
+    def encode_query(self, text: str) -> tuple[np.ndarray, str]:
+        vectors, sources = self.embed_with_sources([text])
+        return vectors[0], (sources[0] if sources else "server")
+
+    def stats_summary(self) -> dict:
+        """Serveri päringuvektorite vahemälu statistika (nagu CachedEmbedder.stats_summary)."""
+        return self.health().get("query_cache", {})
+
+    def search(self, query: str, filters: dict | None = None, k: int = 5,
+               mode: str | None = None) -> tuple[pd.DataFrame, dict]:
+        """(kursuste read koos 'score' veeruga, muu info: route, filtered_count, ...)."""
+        body = {"query": query, "k": k, "filters": filters or {}}
+        if mode:
+            body["mode"] = mode
+        payload = self._request("POST", "/search", body)
+        return pd.DataFrame(payload.pop("results")), payload
@@ -0,0 +1,293 @@
+"""
+retrieval_server.py – Kohalik otsinguserver: mudel ja indeksid laetakse üks kord hosti kohta.
+
+Streamliti rakendus, benchmark ja märkmikud kasutavad sama bge-m3 koopiat
+retrieval_client.RetrievalClient'i kaudu (RETRIEVAL_SERVER_URL), selle asemel
+et iga protsess laeks oma mudeli.
+
+    GET  /health   {"status", "phase", "timings", "courses", "query_cache", "encode_scheduler"}
+    POST /embed    {"texts": [...], "format": "base64"?} -> {"data"/"vectors", "shape", "sources"}
+    POST /search   {"query", "filters"?, "k"?, "mode"?}   -> {"results": [...], "route", "filtered_count", ...}
+
+Filtrid on samas kujus nagu rakenduses (vt facet_index.py); puuduvad võtmed ei piira.
+
+Käivitamine:
+    python retrieval_server.py                          # 127.0.0.1:8765
+    python retrieval_server.py --host 0.0.0.0 --port 9000
+    python retrieval_server.py --load-test --concurrency 8 --requests 400
+    python retrieval_server.py --load-test --endpoint embed --unique
+"""
+
+import argparse
+import base64
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from lexical_index import DEFAULT_RETRIEVAL_MODE, RETRIEVAL_MODES
+from retrieval_client import DEFAULT_SERVER_URL, RetrievalClient
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_K = 100
+MAX_EMBED_TEXTS = 256
+MAX_BODY_BYTES = 1 << 20
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class RetrievalService:
+    """Päringute loogika; HTTP kiht on _Handler-is."""
+
+    def __init__(self, warmup):
+        self.warmup = warmup
+        self._stats_lock = threading.Lock()
+        self.requests = {"embed": 0, "search": 0, "errors": 0}
+
+    def _require_ready(self) -> dict:
+        if not self.warmup.ready:
+            raise RuntimeError(self.warmup.error or f"Soojendus käib ({self.warmup.phase or '…'})")
+        return self.warmup.resources
+
+    def count(self, key: str):
+        with self._stats_lock:
+            self.requests[key] += 1
+
+    def health(self) -> dict:
+        warmup = self.warmup
+        status = "ok" if warmup.ready else "failed" if warmup.failed else "warming"
+        result = {
+            "status": status,
+            "phase": warmup.phase,
+            "timings": {k: round(v, 3) for k, v in warmup.timings.items()},
+            "model": warmup.model_name,
+            "requests": dict(self.requests),
+        }
+        if warmup.error:
+            result["error"] = warmup.error
+        course_index = warmup.resources.get("course_index")
+        if course_index is not None:
+            result["courses"] = len(course_index)
+        embedder = warmup.resources.get("embedder")
+        if embedder is not None:
+            result["query_cache"] = embedder.stats_summary()
+            # Mudeli kutsed käivad läbi EncodeScheduler'i (üks töölõim, mikropartiid)
+            if hasattr(embedder.embedder, "stats"):
+                result["encode_scheduler"] = embedder.embedder.stats()
+        return result
+
+    def embed(self, body: dict) -> dict:
+        texts = body.get("texts")
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            raise BadRequest("'texts' peab olema sõnede list")
+        if len(texts) > MAX_EMBED_TEXTS:
+            raise BadRequest(f"Korraga kuni {MAX_EMBED_TEXTS} teksti")
+        resources = self._require_ready()
+        vectors, sources = resources["embedder"].encode_with_sources(texts)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        result = {"shape": list(vectors.shape), "sources": sources}
+        if body.get("format") == "base64":
+            result["data"] = base64.b64encode(vectors.tobytes()).decode("ascii")
+        else:
+            result["vectors"] = vectors.tolist()
+        return result
+
+    def search(self, body: dict) -> dict:
+        query = body.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise BadRequest("'query' puudub")
+        try:
+            k = int(body.get("k", 5))
+        except (TypeError, ValueError):
+            raise BadRequest("'k' peab olema täisarv")
+        if not 1 <= k <= MAX_K:
+            raise BadRequest(f"'k' peab olema vahemikus 1..{MAX_K}")
+        mode = body.get("mode") or DEFAULT_RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise BadRequest(f"Tundmatu režiim {mode!r} (lubatud: {', '.join(RETRIEVAL_MODES)})")
+        filters = body.get("filters") or {}
+        if not isinstance(filters, dict):
+            raise BadRequest("'filters' peab olema objekt")
+
+        resources = self._require_ready()
+        t0 = time.perf_counter()
+        facet_index = resources["facet_index"]
+        try:
+            bitmap = facet_index.bitmap(filters)
+        except (KeyError, TypeError, ValueError) as e:
+            raise BadRequest(f"Vigased filtrid: {e}")
+        filtered_count = facet_index.count(bitmap=bitmap)
+        results, retrieval = resources["retriever"].top_k(
+            query, k, mask=facet_index.mask(bitmap=bitmap) if filters else None, mode=mode)
+        return {
+            # to_json teisendab NaN -> null
+            "results": json.loads(results.to_json(orient="records", force_ascii=False)),
+            "route": retrieval.route,
+            "query_cache": retrieval.query_cache_source,
+            "filtered_count": filtered_count,
+            "took_ms": round((time.perf_counter() - t0) * 1000, 3),
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: klient taaskasutab ühendust
+    server_version = "OisRetrieval/1.0"
+
+    @property
+    def service(self) -> RetrievalService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/health":
+            health = self.service.health()
+            self._send(200 if health["status"] != "failed" else 500, health)
+        else:
+            self._send(404, {"error": f"Tundmatu aadress: {self.path}"})
+
+    def do_POST(self):
+        routes = {"/embed": self.service.embed, "/search": self.service.search}
+        name = self.path.split("?")[0]
+        handler = routes.get(name)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send(413, {"error": "Päring on liiga suur"})
+            return
+        raw = self.rfile.read(length) if length else b""
+        if handler is None:
+            self._send(404, {"error": f"Tundmatu aadress: {self.path}"})
+            return
+        self.service.count(name.lstrip("/"))
+        try:
+            body = json.loads(raw.decode("utf-8")) if raw else {}
+            if not isinstance(body, dict):
+                raise BadRequest("Päringu keha peab olema JSON objekt")
+            self._send(200, handler(body))
+        except (BadRequest, json.JSONDecodeError, UnicodeDecodeError) as e:
+            self.service.count("errors")
+            self._send(400, {"error": str(e)})
+        except RuntimeError as e:
+            # Soojendus pooleli või ebaõnnestunud
+            self.service.count("errors")
+            self._send(503, {"error": str(e)})
+        except Exception as e:
+            self.service.count("errors")
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+
+def make_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, warmup=None,
+                verbose: bool = False) -> ThreadingHTTPServer:
+    """Loob serveri; mudel laetakse taustal (startup.Warmup), /health näitab olekut."""
+    if warmup is None:
+        from startup import Warmup
+
+        warmup = Warmup().start()
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = RetrievalService(warmup)
+    server.verbose = verbose
+    return server
+
+
+# ---------------------------------------------------------------------------
+# Koormustest
+# ---------------------------------------------------------------------------
+
+def load_test(url: str = DEFAULT_SERVER_URL, endpoint: str = "search", concurrency: int = 8,
+              n_requests: int = 400, k: int = 5, unique: bool = False, limit: int | None = None) -> dict:
+    """
+    Saadab n_requests päringut concurrency lõimest (iga lõim oma püsiva ühendusega)
+    ja prindib läbilaskevõime ning latentsuse protsentiilid.
+    unique=True lisab päringule järjekorranumbri, et vahemälu ei aitaks.
+    """
+    from benchmark import load_test_cases
+
+    queries, _ = load_test_cases(limit)
+    client = RetrievalClient(url)
+    health = client.wait_until_ready()
+    print(f"Server valmis: {health.get('courses')} kursust, mudel {health.get('model')}", flush=True)
+
+    def one(i: int) -> tuple[float, str | None]:
+        query = queries[i % len(queries)] + (f" #{i}" if unique else "")
+        t = time.perf_counter()
+        try:
+            if endpoint == "embed":
+                client.encode([query])
+            else:
+                client.search(query, k=k)
+            return time.perf_counter() - t, None
+        except Exception as e:
+            return time.perf_counter() - t, f"{type(e).__name__}: {e}"
+
+    one(0)  # soojendus
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(n_requests)))
+    wall_s = time.perf_counter() - t0
+
+    latencies = np.array([lat for lat, err in outcomes if err is None]) * 1000
+    errors = [err for _, err in outcomes if err is not None]
+    summary = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": len(errors),
+        "throughput_rps": (n_requests - len(errors)) / wall_s if wall_s else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+    }
+    print("=" * 60)
+    print(f"KOORMUSTEST  /{endpoint}  ({concurrency} lõime, {n_requests} päringut)")
+    print("=" * 60)
+    print(f"Läbilaskevõime:        {summary['throughput_rps']:.1f} päringut/s")
+    print(f"Latentsus p50/p95/p99: {summary['p50_ms']:.1f} / {summary['p95_ms']:.1f} / {summary['p99_ms']:.1f} ms")
+    print(f"Vigu:                  {len(errors)}" + (f"  (nt {errors[0]})" if errors else ""))
+    print("=" * 60)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Kohalik otsinguserver (bge-m3 + kursuste indeksid)")
+    parser.add_argument("--host", type=str, default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--verbose", action="store_true", help="Logi iga päring")
+    parser.add_argument("--load-test", action="store_true", help="Koormustest töötava serveri vastu")
+    parser.add_argument("--url", type=str, default=None, help="Koormustesti serveri aadress")
+    parser.add_argument("--endpoint", choices=("search", "embed"), default="search")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--unique", action="store_true", help="Iga päring erinev (vahemälust mööda)")
+    args = parser.parse_args()
+
+    if args.load_test:
+        load_test(args.url or f"http://{args.host}:{args.port}", endpoint=args.endpoint,
+                  concurrency=args.concurrency, n_requests=args.requests, unique=args.unique)
+        raise SystemExit(0)
+
+    server = make_server(args.host, args.port, verbose=args.verbose)
+    print(f"Otsinguserver kuulab: http://{args.host}:{args.port}  (mudel laeb taustal, vt /health)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
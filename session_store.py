@@ -0,0 +1,293 @@
+"""
+session_store.py – Vestluste püsihoidla (SQLite, WAL-režiim).
+
+Tabelid:
+    sessions    – üks rida vestluse kohta (pealkiri, loomisaeg, tokenid, filtrid);
+                  indeks created_at peal, nii et nimekiri on üks indekseeritud päring
+    messages    – sõnumid (session_id, seq); uued sõnumid ainult lisatakse,
+                  olemasolevaid ridu üle ei kirjutata
+    debug_info  – assistendi vastuste kapotialune info (RAG kontekst, süsteemiviip);
+                  loetakse alles siis, kui seda päriselt vaja läheb
+
+Vanad sessions/*.json failid imporditakse esimesel käivitamisel ühe korra.
+
+Käivitamine:
+    python session_store.py --import sessions   # impordi JSON-failid käsitsi
+    python session_store.py --list              # viimased vestlused
+"""
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+
+import pandas as pd
+
+SESSIONS_DIR = "sessions"
+SESSIONS_DB = os.path.join(SESSIONS_DIR, "sessions.sqlite")
+
+TOKEN_STAT_KEYS = (
+    "total_input_tokens",
+    "total_output_tokens",
+    "total_cost",
+    "latest_input_tokens",
+    "latest_output_tokens",
+    "latest_cost",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    title TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    total_input_tokens INTEGER DEFAULT 0,
+    total_output_tokens INTEGER DEFAULT 0,
+    total_cost REAL DEFAULT 0,
+    latest_input_tokens INTEGER DEFAULT 0,
+    latest_output_tokens INTEGER DEFAULT 0,
+    latest_cost REAL DEFAULT 0,
+    filters TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_created_at ON sessions (created_at);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT,
+    seq INTEGER,
+    role TEXT,
+    content TEXT,
+    has_debug INTEGER DEFAULT 0,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS debug_info (
+    session_id TEXT,
+    seq INTEGER,
+    data TEXT,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+
+# ---------------------------------------------------------------------------
+# debug_info (de)serialiseerimine
+# ---------------------------------------------------------------------------
+
+def debug_to_json(debug: Mapping) -> str:
+    ctx_df = debug.get("context_df")
+    if isinstance(ctx_df, pd.DataFrame):
+        records = ctx_df.to_dict("records") if not ctx_df.empty else []
+    else:
+        records = ctx_df or []
+    data = {k: v for k, v in debug.items() if k != "context_df"}
+    data["context_df"] = records
+    return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def debug_from_json(raw: str) -> dict:
+    data = json.loads(raw)
+    records = data.get("context_df") or []
+    data["context_df"] = pd.DataFrame(records) if records else pd.DataFrame()
+    return data
+
+
+class LazyDebugInfo(Mapping):
+    """
+    Sõnastikulaadne debug_info, mis loetakse andmebaasist esimesel pöördumisel
+    (ja jäetakse meelde). Vestluse laadimisel loetakse seega ainult sõnumite tekst.
+    """
+
+    def __init__(self, store: "SessionStore", session_id: str, seq: int):
+        self._store = store
+        self._session_id = session_id
+        self._seq = seq
+        self._data: dict | None = None
+
+    def _load(self) -> dict:
+        if self._data is None:
+            self._data = self._store.load_debug_info(self._session_id, self._seq) or {}
+        return self._data
+
+    @property
+    def loaded(self) -> bool:
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+
+# ---------------------------------------------------------------------------
+# Hoidla
+# ---------------------------------------------------------------------------
+
+class SessionStore:
+    """Lõimekindel vestluste hoidla; Streamliti seansid jagavad ühte objekti."""
+
+    def __init__(self, db_path: str = SESSIONS_DB):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    # --- kirjutamine ---
+
+    def save_session(self, session_id: str, messages: list[dict], created_at: str,
+                     token_stats: dict | None = None, filters: dict | None = None):
+        """
+        Uuendab vestluse päise ja lisab ainult need sõnumid, mida hoidlas veel pole.
+        Juba salvestatud sõnumeid ja nende debug_info't uuesti ei serialiseerita.
+        """
+        title = next((m["content"][:60] for m in messages if m["role"] == "user"), "Tühi vestlus")
+        stats = {k: (token_stats or {}).get(k, 0) for k in TOKEN_STAT_KEYS}
+        now = time.strftime("%Y-%m-%d %H:%M:%S")
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO sessions (session_id, title, created_at, updated_at, "
+                + ", ".join(TOKEN_STAT_KEYS) + ", filters) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET title = excluded.title, updated_at = excluded.updated_at, "
+                + ", ".join(f"{k} = excluded.{k}" for k in TOKEN_STAT_KEYS) + ", filters = excluded.filters",
+                (session_id, title, created_at, now, *[stats[k] for k in TOKEN_STAT_KEYS],
+                 json.dumps(filters or {}, ensure_ascii=False)),
+            )
+            stored = self._db.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            for seq in range(stored, len(messages)):
+                m = messages[seq]
+                debug = m.get("debug_info")
+                self._db.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, has_debug) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, seq, m["role"], m["content"], int(debug is not None)),
+                )
+                if debug is not None:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO debug_info (session_id, seq, data) VALUES (?, ?, ?)",
+                        (session_id, seq, debug_to_json(debug)),
+                    )
+
+    def delete_session(self, session_id: str):
+        with self._lock, self._db:
+            for table in ("debug_info", "messages", "sessions"):
+                self._db.execute(f"DELETE FROM {table} WHERE session_id = ?", (session_id,))
+
+    # --- lugemine ---
+
+    def count_sessions(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def list_sessions(self, limit: int = 20, offset: int = 0) -> list[dict]:
+        """Viimased vestlused (uuemad eespool) ühe indekseeritud päringuga."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT session_id, title, created_at FROM sessions "
+                "ORDER BY created_at DESC LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [{"session_id": r[0], "title": r[1], "created_at": r[2]} for r in rows]
+
+    def load_session(self, session_id: str):
+        """
+        Tagastab (messages, created_at, token_stats, filters) nagu varasem JSON-laadija.
+        Assistendi sõnumite debug_info on LazyDebugInfo.
+        """
+        with self._lock:
+            header = self._db.execute(
+                "SELECT created_at, " + ", ".join(TOKEN_STAT_KEYS) + ", filters "
+                "FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            rows = self._db.execute(
+                "SELECT seq, role, content, has_debug FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,),
+            ).fetchall()
+        if header is None:
+            raise KeyError(session_id)
+
+        messages = []
+        for seq, role, content, has_debug in rows:
+            entry = {"role": role, "content": content}
+            if has_debug:
+                entry["debug_info"] = LazyDebugInfo(self, session_id, seq)
+            messages.append(entry)
+        token_stats = dict(zip(TOKEN_STAT_KEYS, header[1:1 + len(TOKEN_STAT_KEYS)]))
+        filters = json.loads(header[-1]) if header[-1] else {}
+        return messages, header[0], token_stats, filters
+
+    def load_debug_info(self, session_id: str, seq: int) -> dict | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM debug_info WHERE session_id = ? AND seq = ?", (session_id, seq)
+            ).fetchone()
+        return debug_from_json(row[0]) if row else None
+
+    # --- vanade JSON-failide import ---
+
+    def import_json_sessions(self, sessions_dir: str = SESSIONS_DIR, force: bool = False) -> int:
+        """
+        Impordib sessions/*.json failid (varasem formaat). Vaikimisi tehakse seda
+        ainult ühe korra; juba olemasolevaid vestlusi üle ei kirjutata. Failid jäävad alles.
+        """
+        with self._lock:
+            done = self._db.execute("SELECT value FROM meta WHERE key = 'json_import_done'").fetchone()
+        if done and not force:
+            return 0
+
+        imported = 0
+        for path in sorted(glob.glob(os.path.join(sessions_dir, "*.json"))):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                session_id = data["session_id"]
+            except Exception as e:
+                print(f"Jätan vahele {path}: {e}")
+                continue
+            with self._lock:
+                exists = self._db.execute(
+                    "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+            if exists:
+                continue
+            self.save_session(
+                session_id,
+                data.get("messages", []),
+                data.get("created_at", ""),
+                token_stats={k: data.get(k, 0) for k in TOKEN_STAT_KEYS},
+                filters=data.get("filters", {}),
+            )
+            imported += 1
+
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_import_done', ?)",
+                             (time.strftime("%Y-%m-%d %H:%M:%S"),))
+        return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vestluste hoidla haldus")
+    parser.add_argument("--db", type=str, default=SESSIONS_DB, help="SQLite fail")
+    parser.add_argument("--import", dest="import_dir", type=str, default=None,
+                        help="Impordi selle kausta *.json vestlused")
+    parser.add_argument("--list", action="store_true", help="Näita viimaseid vestlusi")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    if args.import_dir:
+        n = store.import_json_sessions(args.import_dir, force=True)
+        print(f"Imporditud {n} vestlust ({store.count_sessions()} kokku).")
+    if args.list:
+        for s in store.list_sessions(limit=args.limit):
+            print(f"{s['created_at']}  {s['session_id']}  {s['title']}")
@@ -0,0 +1,181 @@
+"""
+startup.py – Rakenduse külmkäivitus: andmed, indeksid ja mudel laetakse taustalõimes.
+
+Streamliti leht (vestlus, varasemad vestlused) kuvatakse kohe; otsing ootab,
+kuni soojendus on valmis. Iga faasi kestus mõõdetakse:
+
+    imports       sentence_transformers (ja torch) import
+    csv           kursuste kataloog (Feather põhiveerud, vt catalog_store.py; varuks CSV)
+    embeddings    vektorite artefakt, CourseIndex ja FacetIndex
+    lexical       BM25 indeks (koodiga päringud saab vastata juba enne mudelit)
+    model         bge-m3 mudeli laadimine
+    first_encode  esimene manustamine (mudeli soojendus)
+
+Kui retrieval_url on antud (RETRIEVAL_SERVER_URL, vt retrieval_server.py), siis
+mudelit selles protsessis ei laeta: "model" faas ootab otsinguserverit ja
+embedderiks saab retrieval_client.RetrievalClient.
+
+Käivitamine:
+    python startup.py        # mõõda käivitusfaasid ja prindi aruanne
+"""
+
+import time
+
+_IMPORT_T0 = time.perf_counter()
+
+import threading
+
+from benchmark import COURSES_CSV, EMBEDDINGS_NPY, EMBEDDINGS_MANIFEST, EMBEDDING_MODEL
+from catalog_store import open_catalog
+from embedding_store import load_course_index
+from encode_scheduler import scheduler_from_env
+from facet_index import FacetIndex
+from lexical_index import FIELD_WEIGHTS, LexicalIndex, Retriever
+from query_cache import CachedEmbedder
+
+PHASES = ("imports", "csv", "embeddings", "lexical", "model", "first_encode")
+PHASE_LABELS = {
+    "imports": "Impordid (sentence_transformers)",
+    "csv": "Kursuste kataloog",
+    "embeddings": "Vektorid ja indeksid",
+    "lexical": "Leksikaalne indeks (BM25)",
+    "model": "Mudeli laadimine",
+    "first_encode": "Esimene manustamine",
+}
+WARMUP_QUERY = "soojendus"
+
+# Rakenduse enda moodulite (pandas, numpy, indeksid) import, enne taustalõime
+APP_IMPORTS_S = time.perf_counter() - _IMPORT_T0
+
+
+class Warmup:
+    """
+    Laeb rakenduse ressursid taustalõimes. Andmed (csv, embeddings) laetakse enne
+    mudelit, nii et filtrid ja indeksid on kasutatavad juba mudeli laadimise ajal.
+
+        warmup = Warmup().start()
+        warmup.data_ready / warmup.ready / warmup.failed
+        warmup.wait()                      # blokeerib kuni valmis (või vea korral)
+        warmup.resources["embedder"]       # CachedEmbedder
+        warmup.resources["course_index"], warmup.resources["facet_index"], warmup.resources["df"]
+        warmup.resources["retriever"]      # lexical_index.Retriever (embedder lisatakse lõpus)
+        warmup.timings                     # {faas: sekundid}
+    """
+
+    def __init__(self, courses_csv: str = COURSES_CSV, npy_path: str = EMBEDDINGS_NPY,
+                 manifest_path: str = EMBEDDINGS_MANIFEST, model_name: str = EMBEDDING_MODEL,
+                 retrieval_url: str | None = None):
+        self.courses_csv = courses_csv
+        self.retrieval_url = retrieval_url
+        self.npy_path = npy_path
+        self.manifest_path = manifest_path
+        self.model_name = model_name
+
+        self.resources: dict = {}
+        self.timings: dict[str, float] = {}
+        self.phase: str | None = None
+        self.error: str | None = None
+        self._data_ready = threading.Event()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+
+    # --- juhtimine ---
+
+    def start(self) -> "Warmup":
+        self._t0 = time.perf_counter()
+        self._thread.start()
+        return self
+
+    @property
+    def data_ready(self) -> bool:
+        return self._data_ready.is_set()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set() and self.error is None
+
+    @property
+    def failed(self) -> bool:
+        return self._done.is_set() and self.error is not None
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Ootab soojenduse lõppu; tagastab True, kui ressursid on kasutatavad."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def wait_for_data(self, timeout: float | None = None) -> bool:
+        self._data_ready.wait(timeout)
+        return self.data_ready
+
+    def report_lines(self) -> list[str]:
+        lines = []
+        for phase in PHASES:
+            if phase in self.timings:
+                lines.append(f"{PHASE_LABELS[phase]:<34}{self.timings[phase]:>8.2f} s")
+        if "total" in self.timings:
+            lines.append(f"{'Kokku (seinakell)':<34}{self.timings['total']:>8.2f} s")
+        return lines
+
+    # --- töö lõimes ---
+
+    def _timed(self, phase: str, fn):
+        self.phase = phase
+        t0 = time.perf_counter()
+        result = fn()
+        self.timings[phase] = time.perf_counter() - t0
+        return result
+
+    def _connect_server(self):
+        from retrieval_client import RetrievalClient
+
+        client = RetrievalClient(self.retrieval_url)
+        client.wait_until_ready()
+        return client
+
+    def _run(self):
+        try:
+            df, text = self._timed("csv", lambda: open_catalog(self.courses_csv))
+
+            def build_indexes():
+                course_index = load_course_index(df, npy_path=self.npy_path, manifest_path=self.manifest_path)
+                course_index.attach_text(text)
+                return course_index, FacetIndex(course_index.df)
+
+            course_index, facet_index = self._timed("embeddings", build_indexes)
+            # BM25 vajab kirjeldust; tekstiveerud loetakse ainult indeksi ehitamiseks
+            lexical_index = self._timed("lexical", lambda: LexicalIndex(course_index.frame(FIELD_WEIGHTS)))
+            self.resources.update(df=df, course_index=course_index, facet_index=facet_index,
+                                  retriever=Retriever(course_index, lexical_index))
+            self._data_ready.set()
+
+            if self.retrieval_url:
+                self.resources["embedder"] = self._timed("model", self._connect_server)
+                self.resources["retriever"].embedder = self.resources["embedder"]
+                return
+
+            def import_model_class():
+                from sentence_transformers import SentenceTransformer
+                return SentenceTransformer
+
+            model_cls = self._timed("imports", import_model_class)
+            model = self._timed("model", lambda: model_cls(self.model_name))
+            # Otse mudelile, mitte vahemälu kaudu: soojendame päriselt mudelit
+            self._timed("first_encode", lambda: model.encode([WARMUP_QUERY]))
+            # Samaaegsete seansside päringud liidetakse partiideks (ENCODE_MAX_WAIT_MS, ENCODE_MAX_BATCH)
+            self.resources["embedder"] = CachedEmbedder(scheduler_from_env(model), self.model_name)
+            self.resources["retriever"].embedder = self.resources["embedder"]
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+        finally:
+            self.timings["total"] = time.perf_counter() - self._t0
+            self.phase = None
+            self._data_ready.set()
+            self._done.set()
+            print("Käivituse ajad:\n  " + "\n  ".join(self.report_lines()), flush=True)
+
+
+if __name__ == "__main__":
+    print(f"Rakenduse moodulite import: {APP_IMPORTS_S:.2f} s", flush=True)
+    warmup = Warmup().start()
+    if not warmup.wait():
+        raise SystemExit(f"❌ Soojendus ebaõnnestus: {warmup.error}")
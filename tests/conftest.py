@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Rakenduse moodulid on repositooriumi juurkaustas
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
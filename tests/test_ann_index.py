@@ -0,0 +1,50 @@
+"""
+ANN indeks kvantiseeritud hoidla peal: indeks ei kopeeri vektoreid ja
+kandidaadid skooritakse float32 vektoritega üle. Sünteetilised vektorid.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ann_index import IVFIndex, _synthetic
+from course_index import CourseIndex, top_positions
+from embedding_store import EmbeddingStore, StoreView
+
+
+@pytest.fixture
+def vectors(tmp_path):
+    matrix = _synthetic(2000, 32, np.random.default_rng(0))
+    npy_path = str(tmp_path / "vektorid.npy")
+    np.save(npy_path, matrix)
+    return matrix, npy_path
+
+
+def test_ivf_empty():
+    index = IVFIndex(np.empty((0, 8), dtype=np.float32))
+    positions, scores = index.search(np.ones(8, dtype=np.float32), k=5)
+    assert len(index) == 0 and len(positions) == 0 and len(scores) == 0
+
+
+@pytest.mark.parametrize("precision", ["int8", "float16"])
+def test_ann_on_store_rescores(vectors, precision):
+    matrix, npy_path = vectors
+    ids = [f"X{i}" for i in range(len(matrix))]
+    store = EmbeddingStore.open(precision, npy_path=npy_path)
+    index = CourseIndex.from_store(pd.DataFrame({"unique_ID": ids}), ids, store).attach_ann("ivf", nprobe=8)
+    assert isinstance(index.ann.matrix, StoreView)
+
+    rng = np.random.default_rng(1)
+    mask = rng.random(len(matrix)) < 0.5
+    recalls = []
+    for row in rng.integers(0, len(matrix), 20):
+        query = matrix[row] + 0.3 * rng.standard_normal(matrix.shape[1]).astype(np.float32)
+        query /= np.linalg.norm(query)
+        positions, scores = index.search(query, k=10, mask=mask)
+        assert mask[positions].all()
+        # Tagastatud skoorid on täpsed float32 skoorid, kahanevas järjekorras
+        np.testing.assert_allclose(scores, matrix[positions] @ query, atol=1e-5)
+        assert np.all(np.diff(scores) <= 0)
+        truth = set(top_positions(matrix @ query, 10, mask)[0].tolist())
+        recalls.append(len(truth & set(positions.tolist())) / 10)
+    assert np.mean(recalls) >= 0.9
@@ -0,0 +1,70 @@
+"""
+BenchmarkJob paralleelselt koos kontrollpunktifailiga: read lisatakse faili
+lõpetamise järjekorras, kuid CSV ja trace peavad olema testjuhtumite
+("indeks") järjekorras. LLM, manustaja ja otsing on asendatud lihtsate
+asendajatega; hilisemad päringud vastavad kiiremini.
+"""
+
+import csv
+import json
+import time
+from types import SimpleNamespace as NS
+
+import numpy as np
+import pandas as pd
+
+import benchmark
+from benchmark import BenchmarkJob, write_results
+from benchmark_log import BenchmarkLog
+
+N_CASES = 8
+
+
+class _Embedder:
+    def encode(self, texts):
+        return np.zeros((len(texts), 4), dtype=np.float32)
+
+
+class _Retriever:
+    def top_k(self, query, k, mode=None, query_vec=None, timer=None):
+        n = int(query.split()[-1])
+        return pd.DataFrame({"unique_ID": [f"LTAT.{n:05d}"], "nimi_et": [f"Kursus {n}"]}), None
+
+
+class _Completions:
+    def create(self, model, messages, stream, **kwargs):
+        n = int(messages[-1]["content"].split()[-1])
+        # Mida hilisem juhtum, seda kiirem vastus -> lõpetamise järjekord on segamini
+        time.sleep(0.02 * (N_CASES - n))
+
+        def chunks():
+            yield NS(choices=[NS(delta=NS(content=f"Soovitan LTAT.{n:05d}"))], usage=None)
+            yield NS(choices=[], usage=NS(prompt_tokens=100, completion_tokens=5))
+        return chunks()
+
+
+def test_parallel_run_writes_rows_in_case_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, "RESULTS_DIR", str(tmp_path))
+    queries = [f"päring {n}" for n in range(N_CASES)]
+    expected = [[f"LTAT.{n:05d}"] for n in range(N_CASES)]
+    indices = list(range(1, N_CASES + 1))
+    run_log = BenchmarkLog.create(str(tmp_path / "jooks.jsonl"), {"test": True})
+    client = NS(chat=NS(completions=_Completions()))
+
+    job = BenchmarkJob(_Embedder(), _Retriever(), client, queries, expected, top_k=1,
+                       concurrency=4, max_retries=0, run_log=run_log).start()
+    events = list(job.iter_events(timeout=0.1))
+    assert events[-1]["type"] == "done", events[-1]
+    assert job.summary["total"] == N_CASES and job.summary["n_errors"] == 0 and job.summary["full_hits"] == N_CASES
+
+    # Kontrollpunktifail jääb lõpetamise järjekorda
+    file_order = [row["indeks"] for row in run_log.iter_rows()]
+    assert sorted(file_order) == indices and file_order != sorted(file_order)
+
+    results_path, _ = write_results(run_log.latest_rows(), job.summary, "test", [], run_name=run_log.run_name)
+    with open(results_path, encoding="utf-8-sig") as f:
+        assert [int(row["indeks"]) for row in csv.DictReader(f)] == indices
+    with open(tmp_path / f"{run_log.run_name}_trace.json", encoding="utf-8") as f:
+        events = json.load(f)["traceEvents"]
+    labels = {e["tid"]: e["args"]["turn"] for e in events}
+    assert [int(labels[t].split(":")[0]) for t in sorted(labels)] == indices
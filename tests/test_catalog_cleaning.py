@@ -0,0 +1,101 @@
+"""
+catalog_cleaning.py väljund peab olema bait-baidilt sama mis
+notebooks/andmete_puhastamine.ipynb märkmiku oma. Märkmiku koodirakud
+käivitatakse väikesel sünteetilisel toorandmete failil.
+"""
+
+import filecmp
+import json
+import os
+import random
+
+import pandas as pd
+import pytest
+
+import catalog_cleaning
+
+NOTEBOOK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "notebooks", "andmete_puhastamine.ipynb")
+
+
+def _raw_catalog(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+
+    def lecturers():
+        return rng.choice(["", "{katki", "[]", json.dumps(
+            [{"person_name": rng.choice(["Mari Mets", "Õie Õun", "Jaan Kask"])} for _ in range(rng.randint(1, 3))]
+            + [{"muu": 1}], ensure_ascii=False)])
+
+    def schedule():
+        entries = [{rng.choice(["time", "start_time", "muu"]):
+                    rng.choice([f"2024-02-{rng.randint(1, 28):02d}T{rng.randint(8, 18):02d}:15:00+02:00", "pole kuupäev"])}
+                   for _ in range(rng.randint(1, 4))]
+        return rng.choice(["", "[1, 2]", json.dumps(entries)])
+
+    def prerequisites():
+        items = [{"code": f"LTAT.0{rng.randint(1, 9)}.00{rng.randint(1, 9)}",
+                  "title": {"et": rng.choice(["Programmeerimine", ""])}} for _ in range(rng.randint(1, 3))]
+        return rng.choice(["", json.dumps({"code": "A"}), json.dumps(items, ensure_ascii=False)])
+
+    rows = []
+    for i in range(n):
+        late = i > n * 0.7
+        rows.append({
+            "code": f"LTAT.{i:05d}",
+            "title__et": f"Aine {i}" if rng.random() > 0.1 else "",
+            "version__title__et": f"Versioon {i}" if rng.random() > 0.3 else "",
+            "nimi_en": f"Course {i}" if rng.random() > 0.2 else "",
+            "hindamine_info": rng.choice(["", "eksam", "projekt"]),
+            "credits": rng.choice([3, 6, 9]) if not (late and rng.random() < 0.2) else "",
+            "version__credits": rng.choice([3, 6, "4.5"]) if rng.random() > 0.2 else "",
+            "overview__description__et": f'Kirjeldus, "jutumärgid"\nreavahetus {i}',
+            "version__overview__description__et": "" if rng.random() < 0.5 else f"V kirjeldus {i}",
+            "overview__learning_outcomes_text_et": "õpiväljund",
+            "additional_info__duration_in_semesters": rng.choice([1, 1, 1, 2]) if not (late and rng.random() < 0.1) else "",
+            "general__type__code": rng.choice(["regular", "practice", "thesis"]),
+            "version__target__semester__et": rng.choice(["kevad", "sügis", ""]),
+            "version__participants__lecturers": lecturers(),
+            "version__schedule__entries": schedule(),
+            "version__target__language__et": rng.choice(["eesti keel", "inglise keel"]),
+            "additional_info__assessment_scale__et": rng.choice(["eristav", "eristamata"]),
+            "version__target__course_main_structural_unit__city": rng.choice(["Tartu", "Tallinn", ""]),
+            "version__additional_info__study_levels": rng.choice(["", json.dumps(
+                [{"et": rng.choice(["bakalaureuseõpe", "magistriõpe"])}, "s"], ensure_ascii=False)]),
+            "version__grading__grade_evaluation__et": str(rng.randint(1, 5)) if i < n * 0.4 else rng.choice(["", "eksam"]),
+            "version__grading__grade_preconditions__et": "",
+            "additional_info__prerequisites": prerequisites(),
+            "kasutamata_veerg": "x" * 20,
+        })
+    return pd.DataFrame(rows)
+
+
+def _run_notebook(workdir):
+    """Käivitab märkmiku koodirakud kaustas workdir (loeb ja kirjutab data/ alla)."""
+    with open(NOTEBOOK, encoding="utf-8") as f:
+        cells = [c for c in json.load(f)["cells"] if c["cell_type"] == "code"]
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        namespace = {}
+        for cell in cells:
+            exec("".join(cell["source"]), namespace)
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize("chunksize,workers", [(37, 1), (50, 2)])
+def test_output_matches_notebook(tmp_path, chunksize, workers):
+    (tmp_path / "data").mkdir()
+    raw_path = tmp_path / "data" / "toorandmed_aasta.csv"
+    _raw_catalog(300).to_csv(raw_path, index=False)
+    _run_notebook(tmp_path)
+    notebook_out = tmp_path / "data" / "andmed_aasta.csv"
+
+    script_out = tmp_path / "skript.csv"
+    stats = catalog_cleaning.clean_catalog(str(raw_path), str(script_out), chunksize=chunksize,
+                                           workers=workers, verbose=False)
+
+    assert stats["rows_in"] == 300
+    assert list(pd.read_csv(script_out, nrows=0).columns) == list(pd.read_csv(notebook_out, nrows=0).columns)
+    assert "nimi_en" in pd.read_csv(script_out, nrows=0).columns
+    assert filecmp.cmp(script_out, notebook_out, shallow=False)
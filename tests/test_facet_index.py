@@ -0,0 +1,76 @@
+"""
+FacetIndex peab andma samad read kui endine pandas_filter_mask. Väike
+sünteetiline kataloog sisaldab kõiki filtriveerge koos puuduvate väärtustega.
+"""
+
+import os
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from facet_index import (ASTE_OPTIONS, CITY_MAP, HIND_MAP, HINDAMIS_OPTIONS, LINN_OPTIONS, SEMESTER_OPTIONS,
+                         VEEB_OPTIONS, FacetIndex, default_filters, pandas_filter_mask, verify)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def _catalog(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = random.Random(seed)
+    cities = [v for values, _ in CITY_MAP.values() for v in values] + ["Kuressaare", None]
+    levels = ["bakalaureuseõpe", "magistriõpe", "doktoriõpe", "bakalaureuseõpe, magistriõpe", "Magistriõpe", None]
+    return pd.DataFrame({
+        "unique_ID": [f"LTAT.{i:05d}" for i in range(n)],
+        "eap": [rng.choice([1.0, 3.0, 4.5, 6.0, 12.0, 30.0, None]) for _ in range(n)],
+        "semester": [rng.choice(SEMESTER_OPTIONS + [None]) for _ in range(n)],
+        "hindamisviis": [rng.choice(list(HIND_MAP.values()) + ["Muu", None]) for _ in range(n)],
+        "linn": [rng.choice(cities) for _ in range(n)],
+        "oppeaste": [rng.choice(levels) for _ in range(n)],
+        "veebiope": [rng.choice(VEEB_OPTIONS + [None]) for _ in range(n)],
+        "eeldusained": [rng.choice(["LTAT.01.001", None]) for _ in range(n)],
+    })
+
+
+def _random_filters(rng: random.Random, max_eap: float) -> dict:
+    lo = rng.choice([0.0, 1.0, 3.0, 4.5, 5.0, 6.0])
+    return {
+        "eap_range": (lo, rng.choice([lo, 6.0, 12.0, max_eap])),
+        "semester_opts": rng.sample(SEMESTER_OPTIONS, rng.randint(0, len(SEMESTER_OPTIONS))),
+        "hindamis_opts": rng.sample(HINDAMIS_OPTIONS, rng.randint(0, len(HINDAMIS_OPTIONS))),
+        "linn_opts": rng.sample(LINN_OPTIONS, rng.randint(0, 3)),
+        "aste_opts": rng.sample(ASTE_OPTIONS, rng.randint(0, len(ASTE_OPTIONS))),
+        "veeb_opts": rng.sample(VEEB_OPTIONS, rng.randint(0, len(VEEB_OPTIONS))),
+        "no_prereqs": rng.random() < 0.3,
+    }
+
+
+@pytest.mark.parametrize("n", [1, 8, 203])
+def test_bitmap_matches_pandas_mask(n):
+    df = _catalog(n, seed=n)
+    facets = FacetIndex(df)
+    rng = random.Random(n)
+    max_eap = float(df["eap"].max()) if df["eap"].notna().any() else 0.0
+    for _ in range(300):
+        filters = _random_filters(rng, max_eap)
+        expected = pandas_filter_mask(df, filters).to_numpy()
+        bitmap = facets.bitmap(filters)
+        assert np.array_equal(facets.mask(bitmap=bitmap), expected), filters
+        assert facets.count(bitmap=bitmap) == int(expected.sum()), filters
+
+
+def test_default_filters_keep_rows_with_eap():
+    df = _catalog(50)
+    facets = FacetIndex(df)
+    filters = default_filters(float(df["eap"].max()))
+    assert facets.count(filters) == int(df["eap"].notna().sum())
+
+
+def test_verify_synthetic_catalog():
+    assert verify(_catalog(120), n_random=200) == 0
+
+
+def test_verify_bundled_catalog_without_all_facets():
+    # Repos olevas kataloogis pole hindamisviis/linn/veebiope veerge
+    df = pd.read_csv(os.path.join(DATA_DIR, "andmed_aasta.csv"))
+    assert verify(df, n_random=50) == 0
@@ -0,0 +1,92 @@
+"""
+prompts.build_prompt: serialiseeritud viiba baidid peavad olema kõigis
+päringutes samad kuni esimese dünaamilise sõnumini (ajalugu, kokkuvõte,
+kontekst, päring) ja ükski dünaamiline tekst ei tohi olla selles prefiksis.
+Iga dünaamiline tekst sisaldab unikaalset märgendit, mille järgi see üles leitakse.
+"""
+
+import json
+import random
+
+import pandas as pd
+
+import prompts
+from context_builder import build_context
+from history import build_history_window, new_summary_state
+from prompts import build_prompt, check_prefix, serialize_messages
+
+MARK = "dyn"
+
+
+def _context_rows(rng: random.Random, tag: str) -> pd.DataFrame:
+    return pd.DataFrame([{
+        "unique_ID": f"LTAT.{rng.randint(0, 99999):05d}",
+        "nimi_et": f"Kursus {MARK}-{tag}-{j}",
+        "eap": rng.choice([3, 6]),
+        "kirjeldus": f'Kirjeldus "jutumärkidega"\nja reavahetusega {MARK}-{tag}-{j}',
+    } for j in range(rng.randint(1, 5))])
+
+
+def _prompts(n_conversations: int = 6, turns: int = 7, seed: int = 0) -> list[prompts.Prompt]:
+    """Vestlused erineva pikkuse, konteksti ja (väikese eelarve tõttu) kokkuvõttega."""
+    rng = random.Random(seed)
+    result = []
+    for c in range(n_conversations):
+        history: list[dict] = []
+        state = new_summary_state()
+        for t in range(turns):
+            tag = f"{c}-{t}"
+            history = history + [{"role": "user", "content": f"Küsimus {MARK}-{tag}? Õpin ka {MARK}-{tag}."}]
+            window = build_history_window(history, state, budget=rng.choice([20, 60, 1000]), summary_budget=80)
+            result.append(build_prompt(build_context(_context_rows(rng, tag)).text, window.messages))
+            history = history + [{"role": "assistant", "content": f"Vastus {MARK}-{tag}. Lisainfo {MARK}-{tag}."}]
+    return result
+
+
+def _first_dynamic(messages: list[dict]) -> int:
+    return next(i for i, m in enumerate(messages) if MARK in m["content"])
+
+
+def test_bytes_identical_up_to_first_dynamic_message():
+    built = _prompts()
+    assert any(m["content"].startswith("Varasema vestluse kokkuvõte") for p in built for m in p.messages)
+    assert len({len(p.messages) for p in built}) > 2
+
+    firsts = {_first_dynamic(p.messages) for p in built}
+    assert len(firsts) == 1
+    first = firsts.pop()
+    assert first >= 1
+
+    prefixes = set()
+    for p in built:
+        raw = serialize_messages(p.messages)
+        static_len = len(serialize_messages(p.messages[:first]))
+        prefix = raw[:static_len]
+        prefixes.add(prefix)
+        assert MARK.encode() not in prefix
+        assert p.prefix_hash == prompts.PREFIX_HASH
+    assert len(prefixes) == 1
+
+
+def test_dynamic_text_not_in_prefix():
+    for p in _prompts(seed=1):
+        first = _first_dynamic(p.messages)
+        prefix = serialize_messages(p.messages[:first])
+        for m in p.messages[first:]:
+            escaped = json.dumps(m["content"], ensure_ascii=False)[1:-1].encode("utf-8")
+            assert escaped not in prefix
+
+
+def test_check_prefix_passes_and_detects_changes():
+    built = _prompts(n_conversations=2, turns=4)
+    assert check_prefix(built)[-1].startswith("✅")
+
+    # Dünaamiline tekst süsteemiprefiksis
+    leaked = build_prompt("kontekst", [{"role": "user", "content": "päring"}])
+    leaked.messages[0] = {"role": "system", "content": leaked.messages[0]["content"] + " " + leaked.messages[-1]["content"]}
+    assert "❌" in check_prefix(built + [leaked])[-1]
+
+    # Ajalugu enne staatilist prefiksit
+    moved = build_prompt("kontekst", [{"role": "user", "content": "varasem"}, {"role": "user", "content": "päring"}])
+    moved.messages.insert(0, moved.messages.pop(1))
+    assert "❌" in check_prefix(built + [moved])[-1]
@@ -0,0 +1,187 @@
+"""
+timing.py – Kerged ajamõõtmise spanid vestluse pöörete ja benchmarki jaoks.
+
+Üks SpanRecorder pöörde (või testjuhtumi) kohta; etapid mõõdetakse
+kontekstihalduriga ja salvestatakse debug_info["timings"] alla (sealt ka
+seansside andmebaasi):
+
+    timer = SpanRecorder()
+    with timer.span("filter"):
+        ...
+    timer.finish()
+    timer.as_debug()   # {"stages": {"filter": 0.4, ..., "total": 812.3}, "spans": [...]}
+
+Etapid (STAGES): filter, encode, search, context, prompt, answer_cache, llm_ttft,
+llm, total.
+Benchmark koondab need p50/p95/p99 kaupa (stage_percentiles). Spanid saab
+eksportida Chrome'i trace-vormingus JSON-ina (chrome://tracing, Perfetto):
+
+    python timing.py --session 20260101_120000 --output trace.json
+"""
+
+import argparse
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+STAGES = ("filter", "encode", "search", "context", "prompt", "answer_cache", "llm_ttft", "llm", "total")
+STAGE_LABELS = {
+    "filter": "Filtrid",
+    "encode": "Päringu manustamine",
+    "search": "Otsing / skoorimine",
+    "context": "Konteksti koostamine",
+    "prompt": "Viiba koostamine",
+    "answer_cache": "Vastuste vahemälu",
+    "llm_ttft": "LLM esimene token",
+    "llm": "LLM kogu vastus",
+    "total": "Pööre kokku",
+}
+PERCENTILES = (50, 95, 99)
+
+
+class SpanRecorder:
+    """
+    t0 – ajatelje nullpunkt (perf_counter); vaikimisi loomise hetk. Benchmark
+    annab kõigile testjuhtumitele sama t0, et paralleelsed juhtumid joonduksid.
+    """
+
+    def __init__(self, t0: float | None = None):
+        self.started = time.perf_counter()
+        self.t0 = t0 if t0 is not None else self.started
+        self.spans: list[dict] = []
+        self.total_ms: float | None = None
+
+    def add(self, name: str, start: float, end: float):
+        """Lisab spani perf_counter() ajatemplite järgi."""
+        self.spans.append({"name": name, "start_ms": round((start - self.t0) * 1000, 3),
+                           "ms": round((end - start) * 1000, 3)})
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def stream(self, iterable, name: str = "llm", first_name: str = "llm_ttft"):
+        """Mähib voo (nt ChatStream): mõõdab aja esimese tükini ja kogu voo kestuse."""
+        start = time.perf_counter()
+        first = True
+        try:
+            for piece in iterable:
+                if first:
+                    self.add(first_name, start, time.perf_counter())
+                    first = False
+                yield piece
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def finish(self) -> float:
+        self.add("total", self.started, time.perf_counter())
+        self.total_ms = self.spans[-1]["ms"]
+        return self.total_ms
+
+    def stage_ms(self) -> dict[str, float]:
+        """Etapi kestus millisekundites (korduvad spanid liidetakse), STAGES järjekorras."""
+        stages: dict[str, float] = {}
+        for span in self.spans:
+            stages[span["name"]] = round(stages.get(span["name"], 0.0) + span["ms"], 3)
+        order = {name: i for i, name in enumerate(STAGES)}
+        return dict(sorted(stages.items(), key=lambda item: order.get(item[0], len(STAGES))))
+
+    def as_debug(self) -> dict:
+        return {"stages": self.stage_ms(), "spans": list(self.spans)}
+
+
+def span(timer: SpanRecorder | None, name: str):
+    """timer.span(name) või tühi kontekst, kui mõõtjat pole."""
+    return timer.span(name) if timer is not None else nullcontext()
+
+
+# ---------------------------------------------------------------------------
+# Koondamine ja eksport
+# ---------------------------------------------------------------------------
+
+def stage_percentiles(stage_rows: list[dict[str, float]]) -> dict[str, dict[str, float]]:
+    """[{etapp: ms}, ...] -> {etapp: {"n", "p50", "p95", "p99"}} (STAGES järjekorras)."""
+    result = {}
+    names = [s for s in STAGES if any(s in row for row in stage_rows)]
+    names += sorted({s for row in stage_rows for s in row} - set(names))
+    for name in names:
+        values = np.array([row[name] for row in stage_rows if row.get(name) is not None], dtype=float)
+        if len(values) == 0:
+            continue
+        result[name] = {"n": int(len(values)),
+                        **{f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}}
+    return result
+
+
+def percentile_lines(percentiles: dict[str, dict[str, float]]) -> list[str]:
+    lines = [f"{'Etapp':<24}{'n':>5}" + "".join(f"{f'p{p} ms':>11}" for p in PERCENTILES)]
+    for name, stats in percentiles.items():
+        label = STAGE_LABELS.get(name, name)
+        lines.append(f"{label:<24}{stats['n']:>5}" + "".join(f"{stats[f'p{p}']:>11.1f}" for p in PERCENTILES))
+    return lines
+
+
+def trace_events(spans: list[dict], tid: int | str = 0, offset_ms: float = 0.0,
+                 label: str | None = None, pid: int = 1) -> list[dict]:
+    """Chrome'i trace-sündmused ("ph": "X", ajad mikrosekundites)."""
+    events = []
+    for s in spans:
+        event = {"name": s["name"], "cat": "turn", "ph": "X", "pid": pid, "tid": tid,
+                 "ts": round((offset_ms + s["start_ms"]) * 1000, 1), "dur": round(s["ms"] * 1000, 1)}
+        if label:
+            event["args"] = {"turn": label}
+        events.append(event)
+    return events
+
+
+def write_trace(path: str, turns: list[tuple[str, list[dict]]], sequential: bool = True):
+    """
+    turns – [(silt, spanid), ...]. sequential=True paigutab pöörded ajateljel
+    järjestikku (üks rida); muidu saab iga pööre oma rea (tid).
+    """
+    events = []
+    offset = 0.0
+    for i, (label, spans) in enumerate(turns):
+        if not spans:
+            continue
+        events += trace_events(spans, tid=0 if sequential else i, offset_ms=offset if sequential else 0.0,
+                               label=label)
+        if sequential:
+            offset += max(s["start_ms"] + s["ms"] for s in spans) + 1.0
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+
+def session_trace(session_id: str, path: str) -> int:
+    """Ekspordib salvestatud vestluse pöörete spanid; tagastab pöörete arvu."""
+    from session_store import SessionStore
+
+    try:
+        messages, _, _, _ = SessionStore().load_session(session_id)
+    except KeyError:
+        raise SystemExit(f"Vestlust {session_id!r} ei leitud.")
+    turns = []
+    for message in messages:
+        debug = message.get("debug_info")
+        timings = debug.get("timings") if debug is not None else None
+        if timings:
+            turns.append(((debug.get("user_prompt") or "")[:60], timings.get("spans", [])))
+    write_trace(path, turns)
+    return len(turns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vestluse ajamõõtmiste eksport Chrome'i trace-vormingus")
+    parser.add_argument("--session", type=str, required=True, help="Vestluse ID (sessions andmebaasist)")
+    parser.add_argument("--output", type=str, default=None, help="Väljundfail (vaikimisi trace_<id>.json)")
+    args = parser.parse_args()
+
+    output = args.output or f"trace_{args.session}.json"
+    n = session_trace(args.session, output)
+    print(f"{n} pööret eksporditud: {output}")